@@ -1,60 +1,207 @@
+import os
 import math
+import bisect
+import hashlib
+import tempfile
+import functools
+import itertools
+from pathlib import Path
+from dataclasses import dataclass
+import numpy as np
 import ezdxf
 import ezdxf.path
 from ezdxf import bbox
-from ezdxf.math import Vec2
+from ezdxf.math import Vec2, Vec3, Z_AXIS
 from ezdxf.addons import Importer
 
 
+@functools.lru_cache(maxsize=4096)
+def _station_label(meters):
+    """
+    将整数米数格式化为 'K1+450' (结果缓存)
+    """
+    # 拆分公里和米，03d 保证米数显示为 010 而不是 10
+    km, m = divmod(meters, 1000)
+    return f"K{km}+{m:03d}"
+
+
+# 分幅数据结构 (slots: 没有实例字典，内存小、属性访问快)
+@dataclass(slots=True)
+class FrameRecord:
+    name: str  # 布局名称 (平面图001)
+    center: tuple  # 帧中心在模型空间的坐标 (x, y)
+    rotation: float  # 道路切线角度 (弧度)
+    scale: float
+    start_station_val: float  # 起始桩号数值 (含起始桩号偏移)
+    end_station_val: float  # 终止桩号数值
+
+    # 格式化后的标签 (例如 'K1+450')，用到时才格式化
+    @property
+    def start_station_label(self):
+        return AutoPlotter._format_m_to_station(self.start_station_val, precision=10)
+
+    @property
+    def end_station_label(self):
+        return AutoPlotter._format_m_to_station(self.end_station_val, precision=10)
+
+
 # ==========================================
 # 1. 路由计算模块
 # ==========================================
 class RouteCalculator:
     def __init__(self, entity, step_precision=0.5):
-        self.path_obj = ezdxf.path.make_path(entity)
-        self.vertices = list(self.path_obj.flattening(distance=step_precision))
-        self.dists = [0.0]
-        for i in range(1, len(self.vertices)):
-            dist = self.vertices[i - 1].distance(self.vertices[i])
-            self.dists.append(self.dists[-1] + dist)
-        self.total_length = self.dists[-1]
+        # 快速路径：全是直线段的中心线直接读取顶点，不需要构造 Path 再 flattening
+        xy = self._straight_vertices(entity)
+        if xy is not None:
+            self.path_obj = None
+        else:
+            # step_precision 是弦高容差：flattening 只细分曲线部分，直线段本身只保留端点
+            self.path_obj = ezdxf.path.make_path(entity)
+            # 顶点流直接写入 (N, 2) 的 float64 数组，不再保留中间的 Vec3 对象列表
+            xy = np.fromiter(
+                itertools.chain.from_iterable((v.x, v.y) for v in self.path_obj.flattening(distance=step_precision)),
+                dtype=np.float64
+            ).reshape(-1, 2)
+        self._set_xy(self._drop_collinear(xy))
+
+    @classmethod
+    def from_xy(cls, xy):
+        """
+        直接由打包好的 (N, 2) 顶点数组构建 (用于从缓存恢复，跳过 DXF 解析与 flattening)
+        """
+        route = cls.__new__(cls)
+        route.path_obj = None
+        route._set_xy(np.asarray(xy, dtype=np.float64))
+        return route
+
+    def _set_xy(self, xy):
+        self._xy = xy
+
+        # 向量化计算每段长度与累计距离 (连续 float64 数组，便于 searchsorted 二分查找)
+        diffs = np.diff(self._xy, axis=0)
+        seg_lens = np.hypot(diffs[:, 0], diffs[:, 1])
+        self.dists = np.concatenate(([0.0], np.cumsum(seg_lens)))
+        self.total_length = float(self.dists[-1])
+
+        # 每段长度的倒数，插值时用乘法代替除法 (零长度段置 0)
+        spans = np.diff(self.dists)
+        self.inv_seg = np.divide(1.0, spans, out=np.zeros_like(spans), where=spans > 0)
+
+        # 单点查询用的 list 副本：bisect 直接在 C 层比较 float，
+        # 坐标也取纯 float，避免每次调用 numpy 标量 / Vec2 对象的开销
+        self._dists_list = self.dists.tolist()
+        self._inv_seg_list = self.inv_seg.tolist()
+        self._xs = xy[:, 0].tolist()
+        self._ys = xy[:, 1].tolist()
+
+    @staticmethod
+    def _straight_vertices(entity):
+        """
+        LINE 或不含凸度 (bulge) 的 LWPOLYLINE 直接返回 (N, 2) 顶点数组；
+        含圆弧或非标准拉伸方向 (OCS != WCS) 时返回 None，交给 make_path 处理
+        """
+        if entity.dxftype() == 'LINE':
+            start, end = entity.dxf.start, entity.dxf.end
+            return np.array([[start.x, start.y], [end.x, end.y]], dtype=np.float64)
+
+        if entity.dxftype() != 'LWPOLYLINE' or not Vec3(entity.dxf.extrusion).isclose(Z_AXIS):
+            return None
+        points = entity.get_points(format='xyb')
+        if any(b != 0 for _, _, b in points):
+            return None
+
+        xy = np.array([(x, y) for x, y, _ in points], dtype=np.float64)
+        if entity.closed:
+            xy = np.vstack((xy, xy[:1]))
+        return xy
+
+    @staticmethod
+    def _drop_collinear(xy, tol=1e-9):
+        """
+        去掉重复点以及直线上多余的共线顶点 (CAD 导出的中心线常按固定间距打点)，
+        路线几何与总长不变，但后续查找/插值的顶点数大幅减少。
+        tol: 判定共线的转角正弦阈值
+        """
+        # 1. 去掉连续重复点
+        nonzero = np.any(np.diff(xy, axis=0) != 0, axis=1)
+        if not nonzero.any():
+            return xy
+        xy = xy[np.concatenate(([True], nonzero))]
+        if len(xy) <= 2:
+            return xy
+
+        # 2. 前后两段同向且叉积为 0 的中间顶点可以去掉
+        d = np.diff(xy, axis=0)
+        d1, d2 = d[:-1], d[1:]
+        cross = d1[:, 0] * d2[:, 1] - d1[:, 1] * d2[:, 0]
+        dot = d1[:, 0] * d2[:, 0] + d1[:, 1] * d2[:, 1]
+        norm = np.hypot(d1[:, 0], d1[:, 1]) * np.hypot(d2[:, 0], d2[:, 1])
+
+        keep = np.ones(len(xy), dtype=bool)
+        keep[1:-1] = (np.abs(cross) > tol * norm) | (dot < 0)
+        return xy[keep]
 
     def get_info_at(self, target_dist):
-        if target_dist >= self.total_length:
-            p1, p2 = self.vertices[-2], self.vertices[-1]
-            return p2, (p2 - p1).angle
-        if target_dist <= 0:
-            p1, p2 = self.vertices[0], self.vertices[1]
-            return p1, (p2 - p1).angle
-
-        idx = 0
-        for i, d in enumerate(self.dists):
-            if d > target_dist:
-                idx = i
-                break
-
-        p_prev = self.vertices[idx - 1]
-        p_next = self.vertices[idx]
-        d_prev = self.dists[idx - 1]
-        d_next = self.dists[idx]
-
-        ratio = (target_dist - d_prev) / (d_next - d_prev)
-        location = p_prev.lerp(p_next, ratio)
-        angle = (p_next - p_prev).angle
-        return location, angle
+        """
+        返回: ((x, y), angle)
+        """
+        xs, ys = self._xs, self._ys
+
+        # 二分查找第一个累计距离大于 target_dist 的顶点 (O(log N))
+        # 超出 [0, total_length] 的距离不单独分支：idx 夹到首/末段，ratio 夹到 [0, 1] 即落在端点
+        dists = self._dists_list
+        idx = bisect.bisect_right(dists, target_dist)
+        idx = min(max(idx, 1), len(dists) - 1)
+
+        x0, y0 = xs[idx - 1], ys[idx - 1]
+        dx, dy = xs[idx] - x0, ys[idx] - y0
+
+        ratio = (target_dist - dists[idx - 1]) * self._inv_seg_list[idx - 1]
+        ratio = min(max(ratio, 0.0), 1.0)
+        return (x0 + dx * ratio, y0 + dy * ratio), math.atan2(dy, dx)
+
+    def get_info_many(self, targets):
+        """
+        批量版 get_info_at：一次 searchsorted + 向量化插值
+        targets: 距离数组，超出 [0, total_length] 的部分落在路线端点
+        返回: (centers (M, 2), angles (M,))
+        """
+        targets = np.asarray(targets, dtype=np.float64)
+        dists, xy = self.dists, self._xy
+
+        idx = np.searchsorted(dists, targets, side='right').clip(1, len(dists) - 1)
+        ratio = (targets - dists[idx - 1]) * self.inv_seg[idx - 1]
+        np.clip(ratio, 0.0, 1.0, out=ratio)
+
+        tangents = xy[idx] - xy[idx - 1]
+        centers = np.empty((len(targets), 2), dtype=np.float64)
+        np.multiply(tangents, ratio[:, None], out=centers)
+        centers += xy[idx - 1]
+        angles = np.arctan2(tangents[:, 1], tangents[:, 0])
+        return centers, angles
 
 
 # ==========================================
 # 2. 自动绘图模块
 # ==========================================
 class AutoPlotter:
-    def __init__(self, dxf_path, centerline_layer="CENTERLINE", standard_frame_margins=[10, 10, 20, 30], scale=1200):
-        print(f"1. 正在读取源文件: {dxf_path} ...")
-        # 步骤 A: 只读读取源文件
-        self.doc = ezdxf.readfile(dxf_path)
-        self.msp = self.doc.modelspace()
+    # 中心线缓存的格式/算法版本：顶点数组的生成方式 (flattening、共线点合并等) 改变时加一，
+    # 旧缓存的键随之失效，不会被误用
+    ROUTE_CACHE_VERSION = 1
+
+    def __init__(self, dxf_path, centerline_layer="CENTERLINE", standard_frame_margins=[10, 10, 20, 30], scale=1200,
+                 route_cache_dir=None):
+        # 步骤 A: 源文件在第一次用到 doc 时才读取 (见 doc 属性)
+        self.dxf_path = dxf_path
+        self._doc = None
         self.centerline_layer = centerline_layer
 
+        # 中心线缓存：内存中每个实例只解析一次；
+        # 指定 route_cache_dir (例如 "~/.cache/highwaype") 时还会落盘，同一文件再次运行可跳过 flattening
+        self.route_cache_dir = route_cache_dir
+        self.step_precision = 0.5
+        self._route = None
+
         # A3 设置
         self.paper_width = 420
         self.paper_height = 297
@@ -64,6 +211,27 @@ class AutoPlotter:
         self.viewport_width = self.paper_width - self.standard_frame_margins[1] - self.standard_frame_margins[3]
         self.viewport_height = self.paper_height - self.standard_frame_margins[0] - self.standard_frame_margins[2]
 
+        # 视口框在“纸上”的位置和大小 (每一页都相同，只算一次)
+        self.vp_center_paper = Vec2(
+            self.standard_frame_margins[3] + self.viewport_width / 2,
+            self.standard_frame_margins[2] + self.viewport_height / 2
+        )
+        self.vp_size_paper = Vec2(self.viewport_width, self.viewport_height)
+
+    @property
+    def doc(self):
+        """
+        源文件文档，第一次访问时才只读读取；中心线命中磁盘缓存时，分幅计算不需要解析 DXF
+        """
+        if self._doc is None:
+            print(f"1. 正在读取源文件: {self.dxf_path} ...")
+            self._doc = ezdxf.readfile(self.dxf_path)
+        return self._doc
+
+    @property
+    def msp(self):
+        return self.doc.modelspace()
+
     def import_frame_block(self, sd_frame_path):
         # 1. 读取图框源文件
         source_doc = ezdxf.readfile(sd_frame_path)
@@ -105,27 +273,97 @@ class AutoPlotter:
         # 1. 按精度取整 (例如 1453 -> 1450)
         rounded_m = round(meters / precision) * precision
 
-        # 2. 拆分公里和米
-        km = int(rounded_m // 1000)
-        m = int(rounded_m % 1000)
+        # 2. 取整后相邻分幅的桩号大量重复，格式化结果按整米缓存
+        return _station_label(math.floor(rounded_m))
+
+    def _route_cache_file(self):
+        """
+        缓存文件路径，键为 (缓存版本, 文件路径, 修改时间, 图层, 精度)；未启用磁盘缓存时返回 None
+        """
+        if self.route_cache_dir is None:
+            return None
+        src = os.path.abspath(self.dxf_path)
+        key = (f"v{self.ROUTE_CACHE_VERSION}|{src}|{os.stat(src).st_mtime_ns}|"
+               f"{self.centerline_layer}|{self.step_precision}")
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return Path(self.route_cache_dir).expanduser() / f"route_{digest}.npy"
+
+    @staticmethod
+    def _load_route_xy(cache_file):
+        """
+        读取缓存的 (N, 2) 顶点数组；只接受纯数值的 .npy (不反序列化任何对象)，
+        形状、类型不对或含非有限值时抛 ValueError
+        """
+        with open(cache_file, 'rb') as f:
+            xy = np.load(f, allow_pickle=False)
+        if xy.dtype != np.float64 or xy.ndim != 2 or xy.shape[0] < 2 or xy.shape[1] != 2:
+            raise ValueError(f"缓存数组格式不对: dtype={xy.dtype}, shape={xy.shape}")
+        if not np.isfinite(xy).all():
+            raise ValueError("缓存数组含非有限值")
+        return xy
 
-        # 3. 格式化字符串 (03d 保证米数显示为 010 而不是 10)
-        return f"K{km}+{m:03d}"
+    @staticmethod
+    def _save_route_xy(cache_file, xy):
+        """
+        写入缓存：先写到同目录下的唯一临时文件再替换，中途失败不会留下半截的缓存，
+        多个进程同时写同一缓存也不会互相覆盖临时文件
+        """
+        tmp_path = None
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=cache_file.parent, prefix=cache_file.stem + '.',
+                                             suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                np.save(f, xy, allow_pickle=False)
+            os.replace(tmp_path, cache_file)
+        except OSError as e:
+            print(f"⚠️ 中心线缓存写入失败: {e}")
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
 
     def get_route(self):
-        # 从源文件中找线
-        polylines = self.msp.query(f'LWPOLYLINE[layer=="{self.centerline_layer}"]')
-        if not polylines:
-            lines = self.msp.query(f'LINE[layer=="{self.centerline_layer}"]')
-            if lines:
-                return RouteCalculator(lines[0])
-            raise ValueError(f"未找到图层 {self.centerline_layer} 上的中心线")
-        longest_pl = max(polylines, key=lambda e: len(e))
-        return RouteCalculator(longest_pl)
+        if self._route is not None:
+            return self._route
 
-    def calculate_frames(self, route, start_PK = 'K0+000'):
-        frames = []
+        cache_file = self._route_cache_file()
+        if cache_file is not None and cache_file.exists():
+            try:
+                self._route = RouteCalculator.from_xy(self._load_route_xy(cache_file))
+                return self._route
+            except (OSError, EOFError, ValueError) as e:
+                print(f"⚠️ 中心线缓存读取失败，重新解析: {e}")
+
+        self._route = self._build_route()
+
+        if cache_file is not None:
+            self._save_route_xy(cache_file, self._route._xy)
+
+        return self._route
+
+    def _build_route(self):
+        # 从源文件中找线：一次遍历模型空间，同时收集该图层上的 LWPOLYLINE 和 LINE
+        polylines, lines = [], []
+        for e in self.msp:
+            if e.dxf.layer != self.centerline_layer:
+                continue
+            dxftype = e.dxftype()
+            if dxftype == 'LWPOLYLINE':
+                polylines.append(e)
+            elif dxftype == 'LINE':
+                lines.append(e)
+
+        # 优先取顶点最多的多段线，没有再退回第一条直线
+        if polylines:
+            longest_pl = max(polylines, key=lambda e: len(e))
+            return RouteCalculator(longest_pl, step_precision=self.step_precision)
+        if lines:
+            return RouteCalculator(lines[0], step_precision=self.step_precision)
+        raise ValueError(f"未找到图层 {self.centerline_layer} 上的中心线")
 
+    def calculate_frames(self, route, start_PK = 'K0+000'):
         # 1. 计算图纸覆盖的模型空间宽度
         model_width = (self.viewport_width * self.scale) / 1000.0
 
@@ -135,184 +373,180 @@ class AutoPlotter:
         # 3. 解析起始桩号的基础数值 (例如 K0+000 -> 0.0, K2+500 -> 2500.0)
         base_offset_m = self._parse_station_to_m(start_PK)
 
-        # 4. 初始化遍历
-        # current_dist 是相对于 route 几何起点的距离
-        current_dist = model_width / 2
-        frame_idx = 1
-
-        while current_dist < route.total_length:
-            # 获取当前帧中心的坐标和角度
-            # 注意：如果最后一段路很短，get_info_at 会自动处理边界
-            center_point, angle_rad = route.get_info_at(current_dist)
-
-            # 计算当前帧覆盖的 [相对] 起止距离 (相对于 Polyline 起点)
-            # 这里的 max/min 是为了防止超出路线总长范围
-            rel_start = max(0, current_dist - model_width / 2)
-            rel_end = min(route.total_length, current_dist + model_width / 2)
-
-            # 计算 [绝对] 桩号数值 (加上起始桩号偏移)
-            abs_start_m = base_offset_m + rel_start
-            abs_end_m = base_offset_m + rel_end
-
-            frames.append({
-                'name': f"平面图{frame_idx:03d}",
-                'center': center_point,
-                'rotation': angle_rad,
-                'scale': self.scale,
-
-                # --- 新增的属性 ---
-                # 原始数值，方便后续如果有数学计算需要
-                'start_station_val': abs_start_m,
-                'end_station_val': abs_end_m,
-
-                # 格式化后的标签 (例如 'K1+450')
-                'start_station_label': self._format_m_to_station(abs_start_m, precision=10),
-                'end_station_label': self._format_m_to_station(abs_end_m, precision=10),
-            })
-
-            # 移动到下一帧
-            current_dist += step_dist
-            frame_idx += 1
-
-            # 边界检查：如果上一帧已经覆盖到了终点，就结束循环
-            if rel_end >= route.total_length:
-                break
+        # 4. 预先算出帧数，再一次性生成所有帧中心的 [相对] 距离 (相对于 route 几何起点)
+        # 第 k 帧中心为 half_width + k * step_dist：
+        #   - 中心必须落在路线内 (中心 < 全长)
+        #   - 第一帧覆盖到终点 (中心 + half_width >= 全长) 之后不再生成
+        half_width = model_width / 2
+        total = route.total_length
+        n_inside = max(0, math.ceil((total - half_width) / step_dist))
+        n_to_end = max(0, math.ceil((total - model_width) / step_dist)) + 1
+        n_frames = min(n_inside, n_to_end)
+        targets = half_width + np.arange(n_frames, dtype=np.float64) * step_dist
+
+        # 5. 批量二分查找 + 向量化插值，得到每帧中心的坐标和角度
+        centers, angles = route.get_info_many(targets)
+
+        # 6. 计算每帧覆盖的 [绝对] 起止桩号 (加上起始桩号偏移)
+        # 这里的 max/min 是为了防止超出路线总长范围
+        abs_starts = base_offset_m + np.maximum(0, targets - half_width)
+        abs_ends = base_offset_m + np.minimum(total, targets + half_width)
+
+        centers = centers.tolist()
+        angles = angles.tolist()
+        abs_starts = abs_starts.tolist()
+        abs_ends = abs_ends.tolist()
+        frames = [
+            FrameRecord(
+                name=f"平面图{i + 1:03d}",
+                center=tuple(centers[i]),
+                rotation=angles[i],
+                scale=self.scale,
+                start_station_val=abs_starts[i],
+                end_station_val=abs_ends[i],
+            )
+            for i in range(len(targets))
+        ]
 
         return frames
 
     def create_layouts(self, frames):
+        if not frames:
+            return
         len_frames = len(frames)
-        for frame in frames:
-            if frame['name'] in self.doc.layouts: continue
-
-            layout = self.doc.layouts.new(frame['name'])
-
-            equal_margin = 0
-            # 步骤 C: 设置页面显示范围 (解决打开是黑屏的问题)
-            layout.page_setup(
-                size=(self.paper_width, self.paper_height),
-                margins=(equal_margin, equal_margin, equal_margin, equal_margin),  # 顺序：顺时针顺序
-                units='mm',
-                offset=(0, 0),  # 顺序：左下
-                rotation=0
-            )
 
-            # ---------------------------------------------------------
-            # 1. 检查图块是否存在 (严格检查)
-            # ---------------------------------------------------------
-            if "standard_frame" not in self.doc.blocks:
-                # 只是大声喊出“有错误！”，但不自杀
-                raise ValueError("【严重错误】DXF中未找到 'standard_frame' 图块，无法继续！")
-
-            # ---------------------------------------------------------
-            # 2. 计算自动缩放比例 (Auto-Scaling)
-            # ---------------------------------------------------------
-            # 获取图块定义的句柄
-            block_def = self.doc.blocks.get("standard_frame")
-
-            # 计算该图块的边界框 (Bounding Box)
-            # cache=None 表示不缓存，确保实时计算
-            extents = bbox.extents(block_def, cache=None)
-
-            # 获取原始宽度和高度
-            orig_width = extents.size.x
-            orig_height = extents.size.y
-
-            # 安全检查：防止除以零（防止图块是空的）
-            if orig_width <= 0 or orig_height <= 0:
-                raise ValueError(f"【错误】图块 'standard_frame' 的尺寸异常 (宽:{orig_width}, 高:{orig_height})，无法计算缩放。")
-
-            # 目标尺寸 (A3)
-            target_width = 420.0
-            target_height = 297.0
-
-            # 计算 X 和 Y 方向所需的缩放因子
-            # 逻辑：目标尺寸 / 原始尺寸 = 需要的缩放倍数
-            scale_factor_x = target_width / orig_width
-            scale_factor_y = target_height / orig_height
-
-            # ---------------------------------------------------------
-            # 3. 插入并应用缩放
-            # ---------------------------------------------------------
-            # 插入图块
-            frame_blk = layout.add_blockref("standard_frame", (0, 0))
-
-            # 应用计算出的比例
-            frame_blk.dxf.xscale = scale_factor_x
-            frame_blk.dxf.yscale = scale_factor_y
-
-            # Z轴通常保持 1.0，或者是 X 和 Y 的较小值（如果是3D块）
-            # 对于2D图框，保持 1.0 或等于 xscale 均可，这里保持 1.0 安全
-            frame_blk.dxf.zscale = 1.0
-
-            # (可选) 打印调试信息，方便你看它到底缩放了多少倍
-            # print(f"图框原始尺寸: {orig_width:.2f}x{orig_height:.2f} -> 缩放倍数 X:{scale_factor_x:.4f}, Y:{scale_factor_y:.4f}")
-
-            # 4. 准备属性数据 (字典)
-            # Key: 必须是图块定义中 ATTDEF 的 "Tag" 名称 (大小写敏感，通常是大写)
-            # Value: 你想填入的具体文字
-
-            # 假设 frame 数据里有 start_station 和 end_station
-            # 格式化桩号字符串，例如: "K0+000 - K0+500"
-            st_str = f"{frame['start_station_label']} - {frame['end_station_label']}"
-
-            # 自动获取当前 layout 的索引作为页码 (或者你自己维护一个计数器)
-            page_num = str(frames.index(frame) + 1)
-
-            values = {
+        # ---------------------------------------------------------
+        # 1. 检查图块是否存在 (严格检查)
+        # ---------------------------------------------------------
+        if "standard_frame" not in self.doc.blocks:
+            # 只是大声喊出“有错误！”，但不自杀
+            raise ValueError("【严重错误】DXF中未找到 'standard_frame' 图块，无法继续！")
+
+        # ---------------------------------------------------------
+        # 2. 计算自动缩放比例 (Auto-Scaling)
+        # ---------------------------------------------------------
+        # 图块定义在循环中不会改变，边界框只需计算一次，所有分幅共用
+        block_def = self.doc.blocks.get("standard_frame")
+
+        # 计算该图块的边界框 (Bounding Box)
+        extents = bbox.extents(block_def, cache=bbox.Cache())
+
+        # 获取原始宽度和高度
+        orig_width = extents.size.x
+        orig_height = extents.size.y
+
+        # 安全检查：防止除以零（防止图块是空的）
+        if orig_width <= 0 or orig_height <= 0:
+            raise ValueError(f"【错误】图块 'standard_frame' 的尺寸异常 (宽:{orig_width}, 高:{orig_height})，无法计算缩放。")
+
+        # 目标尺寸 (A3)
+        target_width = 420.0
+        target_height = 297.0
+
+        # 计算 X 和 Y 方向所需的缩放因子
+        # 逻辑：目标尺寸 / 原始尺寸 = 需要的缩放倍数
+        scale_factor_x = target_width / orig_width
+        scale_factor_y = target_height / orig_height
+
+        # 先纯计算出每一页的布局“配方”，再串行写入 DXF 文档 (ezdxf 文档不是线程安全的)
+        # 已存在的布局名一次性取成集合，每页 O(1) 判断是否跳过
+        existing_names = set(self.doc.layouts.names())
+        plans = []
+        for i, frame in enumerate(frames):
+            if frame.name in existing_names: continue
+            existing_names.add(frame.name)
+            plans.append(self._plan_layout(frame, i + 1, len_frames))
+        for plan in plans:
+            self._apply_plan(plan, scale_factor_x, scale_factor_y)
+
+    @staticmethod
+    def _plan_layout(frame, page_num, len_frames):
+        """
+        纯函数：由 frame 计算布局需要的全部数据，不访问 DXF 文档
+        """
+        # 准备属性数据 (字典)
+        # Key: 必须是图块定义中 ATTDEF 的 "Tag" 名称 (大小写敏感，通常是大写)
+        # Value: 你想填入的具体文字
+        # 格式化桩号字符串，例如: "K0+000 - K0+500"
+        st_str = f"{frame.start_station_label} - {frame.end_station_label}"
+
+        return {
+            'name': frame.name,
+            'attribs': {
                 "桩号范围": st_str,  # 请核对你的图块属性 Tag 是否叫 RANGE
-                "页码": page_num,  # 请核对你的图块属性 Tag 是否叫 PAGENO
+                "页码": str(page_num),  # 请核对你的图块属性 Tag 是否叫 PAGENO
                 "总页码": len_frames  # 还可以填其他固定属性
-            }
+            },
+            # 视口要看“模型空间”里的哪个坐标
+            'target': frame.center,
+            # ezdxf 的属性通常接受“度数(Degrees)”，它内部会自动转弧度
+            'twist_degrees': -math.degrees(frame.rotation),
+        }
 
-            # 5. 自动填充属性
-            # 这个函数会自动查找块定义里的 ATTDEF，并创建对应的 ATTRIB 实体
-            frame_blk.add_auto_attribs(values)
+    def _apply_plan(self, plan, scale_factor_x, scale_factor_y):
+        """
+        把 _plan_layout 生成的配方写入 DXF 文档 (新建布局、插入图框、创建视口)
+        """
+        layout = self.doc.layouts.new(plan['name'])
+
+        equal_margin = 0
+        # 步骤 C: 设置页面显示范围 (解决打开是黑屏的问题)
+        layout.page_setup(
+            size=(self.paper_width, self.paper_height),
+            margins=(equal_margin, equal_margin, equal_margin, equal_margin),  # 顺序：顺时针顺序
+            units='mm',
+            offset=(0, 0),  # 顺序：左下
+            rotation=0
+        )
+
+        # ---------------------------------------------------------
+        # 3. 插入并应用缩放
+        # ---------------------------------------------------------
+        # 插入图块
+        frame_blk = layout.add_blockref("standard_frame", (0, 0))
+
+        # 应用计算出的比例
+        frame_blk.dxf.xscale = scale_factor_x
+        frame_blk.dxf.yscale = scale_factor_y
+
+        # Z轴通常保持 1.0，或者是 X 和 Y 的较小值（如果是3D块）
+        # 对于2D图框，保持 1.0 或等于 xscale 均可，这里保持 1.0 安全
+        frame_blk.dxf.zscale = 1.0
+
+        # 4. 自动填充属性
+        # 这个函数会自动查找块定义里的 ATTDEF，并创建对应的 ATTRIB 实体
+        frame_blk.add_auto_attribs(plan['attribs'])
 
-            # vp_center_paper = (self.paper_width / 2 - equal_margin - self.standard_frame_margins[2],
-            #                    self.paper_height / 2 - equal_margin - self.standard_frame_margins[3])  # 基于 margins, 左下的长度
-            vp_center_paper =(
-                self.standard_frame_margins[3] + self.viewport_width/2,
-                self.standard_frame_margins[2] + self.viewport_height/2
+        try:
+            viewport = layout.add_viewport(
+                center=self.vp_center_paper,  # 视口框在“纸上”的位置
+                size=self.vp_size_paper,  # 视口框在“纸上”的大小, 顺序：左下
+                # 【关键修改 A】: 告诉 ezdxf，视口的“偏移量”是 0
+                # 因为我们要让 target 直接对准中心，不需要再偏移了
+                view_center_point=(0, 0),
+                view_height=(self.paper_height * self.scale) / 1000.0  # 核心：控制出图比例！
             )
 
-            # 步骤 D: 使用正确的属性名 + 正确的数值类型
-            # ezdxf 的属性通常接受“度数(Degrees)”，它内部会自动转弧度
-            twist_degrees = -math.degrees(frame['rotation'])
+            # ✅ 这里就是你文档里查到的正确属性！
+            # 之前代码失效是因为 DXF 版本太低，而不是名字错了
+            # 【关键修改 B】: 把旋转轴心 (Target) 搬到道路中心
+            viewport.dxf.view_target_point = plan['target']
+            viewport.dxf.view_twist_angle = plan['twist_degrees']
 
-            try:
-                viewport = layout.add_viewport(
-                    center=vp_center_paper,  # 视口框在“纸上”的位置
-                    size=(self.paper_width-2*equal_margin - self.standard_frame_margins[1] - self.standard_frame_margins[3],
-                          self.paper_height-2*equal_margin - self.standard_frame_margins[0] - self.standard_frame_margins[2]),  # 视口框在“纸上”的大小, 顺序：左下
-                    # 【关键修改 A】: 告诉 ezdxf，视口的“偏移量”是 0
-                    # 因为我们要让 target 直接对准中心，不需要再偏移了
-                    view_center_point=(0, 0),
-                    view_height=(self.paper_height * self.scale) / 1000.0  # 核心：控制出图比例！
-                )
-
-                # ✅ 这里就是你文档里查到的正确属性！
-                # 之前代码失效是因为 DXF 版本太低，而不是名字错了
-                # viewport.dxf.view_twist_angle = twist_degrees
-                target_location = frame['center']  # 视口要看“模型空间”里的哪个坐标
-                # 【关键修改 B】: 把旋转轴心 (Target) 搬到道路中心
-                viewport.dxf.view_target_point = target_location
-                viewport.dxf.view_twist_angle = twist_degrees
-
-                # 同样把相机位置 (Direction) 搬过来
-                # 这一步是为了保险，让相机看向 Target。如果不设，DXF 有时会默认从原点看过去。
-                # 默认的 view_direction_vector 是 (0, 0, 1) (从顶往下看)，相对坐标，通常不用改。
-                # 但 view_target_point 必须改！
-
-                # 开启并锁定
-                viewport.dxf.status = 1  # 相当于“打开视口”。如果设为 0，视口内是空的，不显示模型空间内容。
-                # 定义锁定的常量
-                VS_DISPLAY_LOCKED = 16384
-                # 获取当前的 flags，然后加上锁定的 flag
-                viewport.dxf.flags = viewport.dxf.flags | VS_DISPLAY_LOCKED
-
-            except Exception as e:
-                print(f"视口创建失败 {frame['name']}: {e}")
+            # 同样把相机位置 (Direction) 搬过来
+            # 这一步是为了保险，让相机看向 Target。如果不设，DXF 有时会默认从原点看过去。
+            # 默认的 view_direction_vector 是 (0, 0, 1) (从顶往下看)，相对坐标，通常不用改。
+            # 但 view_target_point 必须改！
+
+            # 开启并锁定
+            viewport.dxf.status = 1  # 相当于“打开视口”。如果设为 0，视口内是空的，不显示模型空间内容。
+            # 定义锁定的常量
+            VS_DISPLAY_LOCKED = 16384
+            # 获取当前的 flags，然后加上锁定的 flag
+            viewport.dxf.flags = viewport.dxf.flags | VS_DISPLAY_LOCKED
+
+        except Exception as e:
+            print(f"视口创建失败 {plan['name']}: {e}")
 
     def run(self, output_path):
         try:
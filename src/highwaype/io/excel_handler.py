@@ -1,8 +1,13 @@
-import pandas as pd
 import os
+import re
 
 
 class ExcelManager:
+    BASE_TYPE_NAMES = {'Road': '路基', 'Bridge': '桥梁'}
+    HEADERS = ['序号', '设备名称', '桩号', '布设位置', '基础类型', '点位杆件', '点位配置', '备注',
+               '偏距(m)', 'X坐标', 'Y坐标',
+               '数值桩号']  # 这一列通常作为隐藏列或不导出，看需求
+
     @staticmethod
     def save_device_list(devices, output_path, excel_infos):
         """
@@ -12,43 +17,50 @@ class ExcelManager:
             print("⚠️ 没有设备数据，跳过 Excel 导出。")
             return
 
-        print(f"正在导出 Excel 到: {output_path} ...")
+        ExcelManager.save_device_lists([('点位一览表', devices)], output_path, excel_infos)
 
-        base_type_names = {'Road': '路基', 'Bridge': '桥梁'}
-        # 1. 转换为字典列表 (方便 Pandas 处理)
-        data = []
-        for d in devices:
-            data.append({
-                '序号': d.index,
-                '设备名称': d.name,
-                '桩号': d.station_str,
-                '布设位置': d.side,
-                '基础类型':base_type_names[d.base_type],
-                '点位杆件':excel_infos[d.name][0],
-                '点位配置': excel_infos[d.name][1],
-                '备注': None,
-                '偏距(m)': d.offset,
-                'X坐标': d.x,
-                'Y坐标': d.y,
-                '数值桩号': d.station_val # 这一列通常作为隐藏列或不导出，看需求
-            })
-
-        # 2. 创建 DataFrame
-        # df = pd.read_json(pd.io.json.dumps(data))  # 或者直接
-        # df = pd.DataFrame(data)
-        df = pd.DataFrame(data)
-
-        # 3. 导出设置
+    @staticmethod
+    def save_device_lists(groups, output_path, excel_infos):
+        """
+        将多组 DeviceRecord 分别写入同一个 Excel 的多个工作表，工作簿只打开/关闭一次
+        :param groups: [(sheet_name, devices), ...]，devices 为空的组跳过
+        """
+        groups = [(sheet_name, devices) for sheet_name, devices in groups if devices]
+        if not groups:
+            print("⚠️ 没有设备数据，跳过 Excel 导出。")
+            return
+
+        # 逐行数据在写入时才生成，工作簿打开后任何报错都会在退出时留下写了一半的文件，
+        # 所以先确认每种设备都有杆件/配置信息、基础类型都认识、工作表名合法，有问题直接报错
+        missing = sorted({d.name for _, devices in groups for d in devices if d.name not in excel_infos})
+        if missing:
+            raise KeyError(f"excel_infos 中缺少设备: {', '.join(missing)}")
+        unknown = sorted({str(d.base_type) for _, devices in groups for d in devices
+                          if d.base_type not in ExcelManager.BASE_TYPE_NAMES})
+        if unknown:
+            raise KeyError(f"未知的基础类型: {', '.join(unknown)}")
+        ExcelManager._check_sheet_names([sheet_name for sheet_name, _ in groups])
+
+        # xlsxwriter 只有导出 Excel 时才需要，放到这里导入，没装它也能 import highwaype 做出图
         try:
-            # 使用 xlsxwriter 引擎可以设置列宽等样式
-            with pd.ExcelWriter(output_path, engine='xlsxwriter') as writer:
-                df.to_excel(writer, index=False, sheet_name='点位一览表')
+            import xlsxwriter
+        except ImportError as e:
+            raise ImportError("导出 Excel 需要 xlsxwriter，请先执行: pip install xlsxwriter") from e
 
-                # 获取 workbook 和 worksheet 对象进行格式调整
-                workbook = writer.book
-                worksheet = writer.sheets['点位一览表']
+        print(f"正在导出 Excel 到: {output_path} ...")
 
-                # 定义样式
+        # 导出设置
+        try:
+            # 直接用 xlsxwriter 按行写入，constant_memory 模式下写完一行就落盘
+            # 关闭字符串的 URL / 数字 / 公式自动识别，省掉逐单元格的判断
+            options = {
+                'constant_memory': True,
+                'strings_to_urls': False,
+                'strings_to_numbers': False,
+                'strings_to_formulas': False,
+            }
+            with xlsxwriter.Workbook(output_path, options) as workbook:
+                # 定义样式 (整个工作簿只创建一次，各工作表的表头共用)
                 header_fmt = workbook.add_format({
                     'bold': True,
                     'text_wrap': True,
@@ -57,19 +69,67 @@ class ExcelManager:
                     'border': 1
                 })
 
-                # 设置列宽
-                worksheet.set_column('A:A', 5)  # 设备名称宽一点
-                worksheet.set_column('B:B', 40)  # 设备名称宽一点
-                worksheet.set_column('C:C', 10)  # 桩号宽一点
-                worksheet.set_column('D:D', 10)
-                worksheet.set_column('E:E', 10)
-                worksheet.set_column('F:F', 25)
-                worksheet.set_column('G:G', 40)
-
-                # 应用表头样式 (Pandas 默认已经写了表头，这里其实是覆盖样式，稍微复杂)
-                # 简单做法：只要数据存进去就行
+                for sheet_name, devices in groups:
+                    ExcelManager._write_device_sheet(workbook, sheet_name, devices, excel_infos, header_fmt)
 
             print(f"✅ Excel 导出成功！")
 
-        except Exception as e:
-            print(f"❌ Excel 导出失败 (请检查文件是否被打开): {e}")
\ No newline at end of file
+        except (OSError, xlsxwriter.exceptions.FileCreateError) as e:
+            # 只有文件本身写不进去 (被占用、没有权限等) 才在这里提示，其余错误照常抛出
+            print(f"❌ Excel 导出失败 (请检查文件是否被打开): {e}")
+
+    @staticmethod
+    def _check_sheet_names(sheet_names):
+        """
+        按 Excel 的规则检查工作表名：不超过 31 个字符、不含 []:*?/\\、不以单引号开头或结尾、
+        不区分大小写不重复；不合法时抛 ValueError
+        """
+        seen = set()
+        for name in sheet_names:
+            if not name or len(name) > 31:
+                raise ValueError(f"工作表名长度须为 1~31 个字符: '{name}'")
+            if re.search(r"[\[\]:*?/\\]", name) or name.startswith("'") or name.endswith("'"):
+                raise ValueError(f"工作表名含非法字符: '{name}'")
+            if name.lower() in seen:
+                raise ValueError(f"工作表名重复 (不区分大小写): '{name}'")
+            seen.add(name.lower())
+
+    @staticmethod
+    def _write_device_sheet(workbook, sheet_name, devices, excel_infos, header_fmt):
+        """把一组设备写成一个工作表"""
+        base_type_names = ExcelManager.BASE_TYPE_NAMES
+
+        # 1. 逐行生成元组 (只含字符串和数字)，写入时才生成，不先拼出整张表
+        def iter_rows():
+            for d in devices:
+                info = excel_infos[d.name]  # 只查一次字典
+                yield (
+                    d.index,
+                    d.name,
+                    d.station_str,
+                    d.side,
+                    base_type_names[d.base_type],
+                    info[0],
+                    info[1],
+                    None,
+                    d.offset,
+                    d.x,
+                    d.y,
+                    d.station_val,
+                )
+
+        worksheet = workbook.add_worksheet(sheet_name)
+
+        # 2. 设置列宽 (constant_memory 模式下要在写数据之前设置)
+        worksheet.set_column('A:A', 5)  # 设备名称宽一点
+        worksheet.set_column('B:B', 40)  # 设备名称宽一点
+        worksheet.set_column('C:C', 10)  # 桩号宽一点
+        worksheet.set_column('D:D', 10)
+        worksheet.set_column('E:E', 10)
+        worksheet.set_column('F:F', 25)
+        worksheet.set_column('G:G', 40)
+
+        # 3. 按行顺序写入表头和数据
+        worksheet.write_row(0, 0, ExcelManager.HEADERS, header_fmt)
+        for row, values in enumerate(iter_rows(), start=1):
+            worksheet.write_row(row, 0, values)
@@ -1,6 +1,7 @@
 import math
+import re
+import numpy as np
 import ezdxf
-import ezdxf.path
 from ezdxf.addons import Importer
 from ezdxf.math import Vec2
 import ezdxf.bbox
@@ -8,6 +9,9 @@ from dataclasses import dataclass
 # 增加文字对齐枚举
 from ezdxf.enums import TextEntityAlignment
 
+# 常见的 'K12+345.6' 格式用预编译的正则一次解析，其余格式走 parse_pk_string 里的通用处理
+_PK_RE = re.compile(r'^\s*K?\s*(\d+)\s*\+\s*(\d+(?:\.\d+)?)\s*$', re.IGNORECASE)
+
 
 # 定义一个简单的设备数据结构
 @dataclass
@@ -24,137 +28,68 @@ class DeviceRecord:
     y: float
 
 
-class LegacyRouteCalculator:
-    """
-    核心路由计算器 (升级版)
-    增加了 project_point 方法：将任意坐标投影到中心线上，获取桩号和偏距
-    """
-
-    def __init__(self, entity, step_precision=0.5):
-        # 1. 转为 Path 并打散
-        self.path_obj = ezdxf.path.make_path(entity)
-        # flattening 得到的是密集的顶点列表
-        self.vertices = list(self.path_obj.flattening(distance=step_precision))
-
-        # 2. 预计算每一段的长度和累计桩号
-        self.dists = [0.0]  # 每个点的累计桩号 [0, 1.2, 2.5 ...]
-        self.segments = []  # 存储线段向量，加速计算
-
-        for i in range(1, len(self.vertices)):
-            p_prev = self.vertices[i - 1]
-            p_curr = self.vertices[i]
-
-            seg_len = p_prev.distance(p_curr)
-            cumulative = self.dists[-1] + seg_len
-
-            self.dists.append(cumulative)
-            self.segments.append({
-                'p1': p_prev,
-                'p2': p_curr,
-                'len': seg_len,
-                'start_dist': self.dists[i - 1],
-                'vec': p_curr - p_prev  # 预计算向量
-            })
-
-        self.total_length = self.dists[-1]
-
-    def project_point(self, target_point: Vec2):
-        """
-        核心算法：将外部点投影到最近的中心线段上
-        返回: (station, offset, side_str)
-        """
-        min_dist = float('inf')
-        best_station = 0.0
-        best_side = "Center"
-
-        # 遍历所有微元线段，寻找最近点
-        # (注：对于超长公路，这里可以用 R-Tree 空间索引优化，但对于几百个设备，暴力遍历足够快)
-        for seg in self.segments:
-            p1 = seg['p1']
-            vec_seg = seg['vec']  # 线段向量
-            seg_len_sq = vec_seg.magnitude_xy  # 长度平方
-
-            if seg_len_sq == 0: continue
-
-            # 向量投影: 计算点 P 在线段 AB 上的投影比例 t
-            # t = (AP · AB) / |AB|^2
-            vec_pt = target_point - p1
-            t = vec_pt.dot(vec_seg) / seg_len_sq
-
-            # 限制 t 在 [0, 1] 之间（夹在端点内）
-            t_clamped = max(0.0, min(1.0, t))
-
-            # 计算投影点坐标
-            projected_p = p1 + vec_seg * t_clamped
-
-            # 计算垂直距离 (Offset)
-            dist = target_point.distance(projected_p)
-
-            if dist < min_dist:
-                min_dist = dist
-
-                # 1. 计算桩号
-                best_station = seg['start_dist'] + (t_clamped * seg['len'])
-
-                # 2. 判断左右侧 (使用二维叉乘)
-                # 叉乘: A x B = x1*y2 - x2*y1
-                # 如果结果 > 0，点在向量左侧；< 0 在右侧 (取决于坐标系，CAD通常遵循右手定则)
-                cross_product = vec_seg.x * vec_pt.y - vec_seg.y * vec_pt.x
-                best_side = "左幅外侧" if cross_product > 0 else "右幅外侧"
-
-        return best_station, min_dist, best_side
-
-
 class RouteCalculator:
     """
     核心路由计算器 (定距逻辑版 - 修复 Vec2 属性报错)
     """
 
+    # 线段数不超过该值时，project_point 走标量循环
+    SCALAR_MAX_SEGMENTS = 64
+
     def __init__(self, entity, start_PK="K0+000"):
         # 0. 解析起始桩号
         self.base_offset = self.parse_pk_string(start_PK)
 
-        # 1. 提取顶点
-        raw_points = []
+        # 1. 提取顶点，直接读成 [N, 2] 的 float64 数组
         if entity.dxftype() == 'LWPOLYLINE':
-            raw_points = entity.get_points(format='xy')
+            pts = np.fromiter(entity.vertices(), dtype=(np.float64, 2), count=len(entity))
         elif entity.dxftype() == 'LINE':
-            raw_points = [entity.dxf.start, entity.dxf.end]
+            pts = np.array([entity.dxf.start.vec2, entity.dxf.end.vec2], dtype=np.float64)
         else:
             raise TypeError("RouteCalculator 输入必须是 LWPOLYLINE 或 LINE")
 
-        # 2. 预计算每一段
-        self.segments = []
-
-        for i in range(len(raw_points) - 1):
-            # 强制转为 Vec2
-            p_prev = Vec2(raw_points[i])
-            p_curr = Vec2(raw_points[i + 1])
-
-            vec = p_curr - p_prev
-
-            # --- 核心修复：手动计算长度平方 ---
-            # 某些版本的 ezdxf Vec2 没有 magnitude_sq 属性
-            # 我们直接用 x*x + y*y 代替，效果完全一样且更快
-            len_sq = vec.x * vec.x + vec.y * vec.y
-
-            start_stat = self.base_offset + (i * 100.0)
-
-            self.segments.append({
-                'p1': p_prev,
-                'p2': p_curr,
-                'vec': vec,
-                'len_sq': len_sq,  # <--- 这里使用了修复后的变量
-                'start_stat': start_stat,
-                'logic_span': 100.0
-            })
-
-        self.total_length = self.segments[-1]['start_stat'] + 100.0
+        # 2. SoA 布局：各字段存为连续的 float64 数组，project_point 整体向量化计算
+        # 长度平方直接用 x*x + y*y 计算 (某些版本的 ezdxf Vec2 没有 magnitude_sq 属性)
+        vec = np.diff(pts, axis=0)
+        self.logic_span = 100.0  # 每段对应的逻辑桩号长度
+        self.seg = {
+            'p1x': pts[:-1, 0],
+            'p1y': pts[:-1, 1],
+            'vx': vec[:, 0],
+            'vy': vec[:, 1],
+            'len_sq': vec[:, 0] * vec[:, 0] + vec[:, 1] * vec[:, 1],
+            'start_stat': self.base_offset + np.arange(len(vec)) * self.logic_span,
+        }
+        self.total_length = float(self.seg['start_stat'][-1]) + self.logic_span
+
+        # 3. 每段方向的 cos/sin (方向角与 Vec2.angle 一样用 math.atan2)，按段号直接查表
+        seg_angles = [math.atan2(vy, vx) for vx, vy in vec.tolist()]
+        self.seg_cos = [math.cos(a) for a in seg_angles]
+        self.seg_sin = [math.sin(a) for a in seg_angles]
+
+        # 线段不多时，单点投影直接用纯 Python 标量循环 (NumPy 每次调用的固定开销反而占大头)
+        # 各段字段按行打包成元组列表，只在这种情况下准备
+        # 每段附带轴对齐包围盒，循环里先用点到包围盒的距离做下界，明显更远的段直接跳过
+        self._seg_rows = None
+        if len(vec) <= self.SCALAR_MAX_SEGMENTS:
+            p1, p2 = pts[:-1], pts[1:]
+            bbox_min = np.minimum(p1, p2)
+            bbox_max = np.maximum(p1, p2)
+            self._seg_rows = list(zip(
+                bbox_min[:, 0].tolist(), bbox_min[:, 1].tolist(), bbox_max[:, 0].tolist(), bbox_max[:, 1].tolist(),
+                *(self.seg[k].tolist() for k in ('p1x', 'p1y', 'vx', 'vy', 'len_sq', 'start_stat'))))
+
+        # 单点投影结果缓存：同一坐标重复投影时直接查字典
+        self._proj_cache = {}
 
     @staticmethod
     def parse_pk_string(pk_str):
         if isinstance(pk_str, (int, float)):
             return float(pk_str)
+        m = _PK_RE.match(pk_str)
+        if m:
+            # 公里数按整数相乘，只有米数需要转 float
+            return int(m.group(1)) * 1000 + float(m.group(2))
         clean_str = pk_str.upper().replace('K', '').replace(' ', '')
         if '+' in clean_str:
             try:
@@ -167,34 +102,135 @@ class RouteCalculator:
         except ValueError:
             return 0.0
 
-    def project_point(self, target_point: Vec2):
-        min_dist = float('inf')
-        best_station = 0.0
-        best_side = "Center"
-
-        for seg in self.segments:
-            p1 = seg['p1']
-            vec_seg = seg['vec']
-            seg_len_sq = seg['len_sq']
+    def segment_indices_at(self, station_vals):
+        """
+        返回各桩号所在线段序号的数组，不在任何线段上时为 -1
+        每段逻辑长度固定为 logic_span，直接除法定位；
+        再检查相邻几段，保证边界上的桩号与按顺序查找时落在同一段
+        """
+        stations = np.asarray(station_vals, dtype=np.float64)
+        start_stat = self.seg['start_stat']
+        n = len(start_stat)
+        guess = ((stations - self.base_offset) // self.logic_span).astype(np.int64)
+
+        result = np.full(len(stations), -1, dtype=np.int64)
+        # 检查猜测段前后相邻的几段；从后往前写入，序号小的段优先
+        for off in (1, 0, -1, -2):
+            i = guess + off
+            s0 = start_stat[np.clip(i, 0, n - 1)]
+            hit = (i >= 0) & (i < n) & (s0 <= stations) & (stations <= s0 + self.logic_span)
+            result[hit] = i[hit]
+        return result
 
-            if seg_len_sq == 0:
-                t_clamped = 0.0
-            else:
-                vec_pt = target_point - p1
-                # 向量点积：x1*x2 + y1*y2
-                t = vec_pt.dot(vec_seg) / seg_len_sq
-                t_clamped = max(0.0, min(1.0, t))
+    def project_point(self, target_point: Vec2):
+        """
+        将外部点投影到最近的中心线段上 (单点版)
+        线段数不超过 SCALAR_MAX_SEGMENTS 时用 _project_scalar 逐段计算，
+        否则走 _project_block 的向量化计算；两者结果逐位相同，按坐标缓存
+        返回: (station, offset, side_str)
+        """
+        key = (target_point.x, target_point.y)
+        cached = self._proj_cache.get(key)
+        if cached is not None:
+            return cached
 
-            projected_p = p1 + vec_seg * t_clamped
-            dist = target_point.distance(projected_p)
+        if self._seg_rows is not None:
+            result = self._project_scalar(key[0], key[1])
+        else:
+            stations, offsets, sides = self._project_block(
+                np.array([key[0]], dtype=np.float64),
+                np.array([key[1]], dtype=np.float64),
+            )
+            result = float(stations[0]), float(offsets[0]), str(sides[0])
+        self._proj_cache[key] = result
+        return result
 
-            if dist < min_dist:
-                min_dist = dist
-                best_station = seg['start_stat'] + (t_clamped * seg['logic_span'])
-                cross_product = vec_seg.x * vec_pt.y - vec_seg.y * vec_pt.x
-                best_side = "左幅外侧" if cross_product > 0 else "右幅外侧"
+    def _project_scalar(self, tx, ty):
+        """
+        单点投影的标量版：逐段计算，运算顺序与 _project_block 完全一致，结果逐位相同
+        距离相等时保留序号小的段 (与 argmin 一致)
+        """
+        min_d2 = math.inf
+        best = None
+        for minx, miny, maxx, maxy, p1x, p1y, vx, vy, len_sq, start_stat in self._seg_rows:
+            # 点到包围盒距离的平方是到该段距离平方的下界；留一点余量吸收舍入误差，
+            # 只跳过确定比当前最优更远的段，结果与逐段全算完全一致
+            bx = max(minx - tx, 0.0, tx - maxx)
+            by = max(miny - ty, 0.0, ty - maxy)
+            if bx * bx + by * by > min_d2 * 1.000001 + 1e-9:
+                continue
 
-        return best_station, min_dist, best_side
+            dx = tx - p1x
+            dy = ty - p1y
+            t = (dx * vx + dy * vy) / len_sq if len_sq > 0 else 0.0
+            if t < 0.0:
+                t = 0.0
+            elif t > 1.0:
+                t = 1.0
+
+            ex = tx - (p1x + vx * t)
+            ey = ty - (p1y + vy * t)
+            d2 = ex * ex + ey * ey
+            if d2 < min_d2:
+                min_d2 = d2
+                best = (start_stat, t, vx * dy - vy * dx)
+
+        start_stat, t, cross_product = best
+        side = "左幅外侧" if cross_product > 0 else "右幅外侧"
+        return start_stat + t * self.logic_span, math.sqrt(min_d2), side
+
+    def project_points(self, xs, ys, max_block_cells=1_000_000):
+        """
+        批量投影：所有点 [N, 1] 与所有线段 [1, M] 广播，一次算出全部结果
+        点数很多时按行分块计算，每块的中间数组不超过 max_block_cells 个元素，避免 N*M 内存暴涨
+        返回: (stations, offsets, sides) 三个长度为 N 的数组
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+
+        # 很多设备块叠放在同一位置：只投影不重复的坐标，再按 inverse 展开回原顺序
+        uniq, inverse = np.unique(np.column_stack((xs, ys)), axis=0, return_inverse=True)
+        if len(uniq) < len(xs):
+            stations, offsets, sides = self.project_points(uniq[:, 0], uniq[:, 1], max_block_cells)
+            inverse = inverse.reshape(-1)
+            return stations[inverse], offsets[inverse], sides[inverse]
+
+        n_points, n_segs = len(xs), len(self.seg['len_sq'])
+
+        block = max(1, max_block_cells // max(n_segs, 1))
+        if n_points <= block:
+            return self._project_block(xs, ys)
+
+        parts = [self._project_block(xs[i:i + block], ys[i:i + block]) for i in range(0, n_points, block)]
+        stations, offsets, sides = zip(*parts)
+        return np.concatenate(stations), np.concatenate(offsets), np.concatenate(sides)
+
+    def _project_block(self, xs, ys):
+        """project_points 的单块计算"""
+        seg = self.seg
+        tx = xs[:, None]
+        ty = ys[:, None]
+        p1x, p1y = seg['p1x'][None, :], seg['p1y'][None, :]
+        vx, vy, len_sq = seg['vx'][None, :], seg['vy'][None, :], seg['len_sq'][None, :]
+
+        dx = tx - p1x
+        dy = ty - p1y
+        t = np.divide(dx * vx + dy * vy, len_sq, out=np.zeros(dx.shape), where=len_sq > 0)
+        np.clip(t, 0.0, 1.0, out=t)
+
+        ex = tx - (p1x + vx * t)
+        ey = ty - (p1y + vy * t)
+        d2 = ex * ex + ey * ey
+
+        # 每个点最近的线段
+        best = d2.argmin(axis=1)
+        rows = np.arange(len(best))
+
+        stations = seg['start_stat'][best] + t[rows, best] * self.logic_span
+        offsets = np.sqrt(d2[rows, best])
+        cross_product = seg['vx'][best] * dy[rows, best] - seg['vy'][best] * dx[rows, best]
+        sides = np.where(cross_product > 0, "左幅外侧", "右幅外侧")
+        return stations, offsets, sides
 
 
 class DeviceLayoutEngine:
@@ -222,8 +258,17 @@ class DeviceLayoutEngine:
                 s_val, e_val = e_val, s_val
             self.bridge_ranges.append((s_val, e_val))
 
+        # 按起点排序，并记录"起点不晚于当前桥的所有桥"的最远终点 (允许桥梁范围相互重叠)
+        # 判断某桩号是否在桥上只需二分找到最后一座起点 <= 桩号的桥，再和这个最远终点比较
+        sorted_ranges = sorted(self.bridge_ranges)
+        self._bridge_starts = np.array([s for s, _ in sorted_ranges], dtype=np.float64)
+        self._bridge_max_ends = np.maximum.accumulate(np.array([e for _, e in sorted_ranges], dtype=np.float64))
+
         print(f"已加载 {len(self.bridge_ranges)} 座桥梁范围用于基础类型判断。")
 
+        # 布局视口参数数组，首次查询视口时再扫描各布局 (见 _viewport_arrays)
+        self._vp = None
+
         # 确保标注字体样式存在
         if 'LegendTextStyle' not in self.doc.styles:
             # doc.styles.new('DimStyle', dxfattribs={'font': '仿宋_GB2312.ttf'})
@@ -243,134 +288,154 @@ class DeviceLayoutEngine:
         target_pl = max(polylines, key=lambda e: len(e))
         return RouteCalculator(target_pl)
 
+    def _on_bridge(self, station_vals):
+        """批量判断桩号是否落在任一桥梁范围内 (含边界)，返回布尔数组"""
+        station_vals = np.asarray(station_vals, dtype=np.float64)
+        if len(self._bridge_starts) == 0:
+            return np.zeros(len(station_vals), dtype=bool)
+        i = np.searchsorted(self._bridge_starts, station_vals, side='right') - 1
+        return (i >= 0) & (station_vals <= self._bridge_max_ends[np.maximum(i, 0)])
+
     def format_station(self, station_val):
         """将 12345.67 格式化为 K12+345.67"""
         km = int(station_val // 1000)
         m = int(station_val % 1000)
         return f"K{km}+{m:03d}"
 
+    @staticmethod
+    def format_stations(station_vals):
+        """format_station 的批量版：对整个桩号数组一次性格式化，返回字符串列表"""
+        station_vals = np.asarray(station_vals, dtype=np.float64)
+        # 叠放的设备桩号相同：只格式化不重复的桩号，再按 inverse 展开
+        uniq, inverse = np.unique(station_vals, return_inverse=True)
+        if len(uniq) == 0:
+            return []
+        km = (uniq // 1000).astype(np.int64).astype(str)
+        m = (uniq % 1000).astype(np.int64).astype(str)
+        strs = np.char.add(np.char.add('K', km), np.char.add('+', np.char.zfill(m, 3)))
+        return strs[inverse.reshape(-1)].tolist()
+
     def extract_and_project_devices(self, target_block_names=None):
         """
         读取所有 INSERT 实体，过滤出指定的设备块，并计算桩号
         :param target_block_names: dict, 例如 ['CCTV': '中文名称', 'VMS': '中文名称', 'Camera': '中文名称']，为 None 则提取所有块
         """
         devices = []
-        index = 1
-
-        # 查询所有块引用
-        inserts = self.msp.query('INSERT')
-
-        print(f"共发现 {len(inserts)} 个图块，正在筛选并计算投影...")
-
-        for entity in inserts:
-            block_name = entity.dxf.name
 
-            # 过滤块名
-            if target_block_names and block_name not in target_block_names.keys():
-                continue
-
-            # 获取插入点 (Vec2)
-            insert_pos = Vec2(entity.dxf.insert.x, entity.dxf.insert.y)
-
-            # --- 核心调用：投影计算 ---
-            station, offset, side = self.route.project_point(insert_pos)
+        # 查询块引用：指定了设备块时把块名过滤直接写进查询条件 (整名匹配，区分大小写)
+        if target_block_names:
+            names = '|'.join(re.escape(name) for name in target_block_names)
+            inserts = self.msp.query(f'INSERT[name ? "^({names})$"]')
+        else:
+            inserts = self.msp.query('INSERT')
+
+        print(f"共发现 {len(inserts)} 个设备图块，正在计算投影...")
+
+        # 1. 收集实体和块名
+        entities = list(inserts)
+        block_names = [entity.dxf.name for entity in entities]
+
+        # 2. --- 核心调用：所有设备一次性批量投影 ---
+        if block_names:
+            # 插入点一次性读入 [N, 3] 数组，取 X / Y 两列，不再逐个拆成 float
+            # 列切片是跨步视图，拷成连续数组后再参与后面的广播和排序
+            pts = np.fromiter((e.dxf.insert for e in entities), dtype=(np.float64, 3), count=len(entities))
+            xs = np.ascontiguousarray(pts[:, 0])
+            ys = np.ascontiguousarray(pts[:, 1])
+            stations, offsets, sides = self.route.project_points(xs, ys)
+
+            # 3. 按列处理：整列按桩号排序 (稳定排序，从小到大)，整列保留 3 位小数
+            order = np.argsort(stations, kind='stable')
+            stations = stations[order]
+            station_strs = self.format_stations(stations)
+            on_bridge = self._on_bridge(stations).tolist()
+            stations = stations.tolist()
+            sides = sides[order].tolist()
+            offsets = np.round(offsets[order], 3).tolist()
+            xs = np.round(xs[order], 3).tolist()
+            ys = np.round(ys[order], 3).tolist()
+            block_names = [block_names[k] for k in order.tolist()]
 
             # --- 新增逻辑：判断基础类型 (Bridge vs Road) ---
-            # 默认为路基
-            current_base_type = 'Road'
-
-            # 遍历所有桥梁范围进行比对
-            for b_start, b_end in self.bridge_ranges:
-                # 判断当前桩号是否在桥梁范围内
-                # 使用 <= 可以包含边界，根据具体业务需求调整
-                if b_start <= station <= b_end:
-                    current_base_type = 'Bridge'  # 拼写更正为 Bridge (桥梁)
-                    break  # 找到所在桥梁后，无需继续遍历
-
-            # 记录数据
-            rec = DeviceRecord(
-                index=index,
-                name=target_block_names[block_name],
-                name_str=block_name,
-                station_str=self.format_station(station),
-                station_val=station,
-                base_type=current_base_type,
-                side=side,
-                offset=round(offset, 3),  # 保留3位小数
-                x=round(insert_pos.x, 3),
-                y=round(insert_pos.y, 3)
-            )
-            devices.append(rec)
-            index += 1
-
-        # 按桩号排序 (从小到大)
-        devices.sort(key=lambda d: d.station_val)
-
-        # 重新生成序号
-        for i, d in enumerate(devices):
-            d.index = i + 1
+            # 桩号落在任一桥梁范围内 (含边界) 为桥梁，否则默认为路基
+            base_types = ['Bridge' if b else 'Road' for b in on_bridge]
+
+            # 4. 已按桩号排好序，各列对齐后一次性生成记录，序号即排序后的位置
+            devices = [
+                DeviceRecord(
+                    index=k,
+                    name=target_block_names[block_name],
+                    name_str=block_name,
+                    station_str=station_str,
+                    station_val=station,
+                    base_type=base_type,
+                    side=side,
+                    offset=offset,  # 已保留3位小数
+                    x=x,
+                    y=y
+                )
+                for k, (block_name, station_str, station, base_type, side, offset, x, y) in enumerate(
+                    zip(block_names, station_strs, stations, base_types, sides, offsets, xs, ys), start=1)
+            ]
 
         print(f"✅ 处理完成，共提取有效设备 {len(devices)} 个")
         return devices
 
-    # 1. 新增辅助方法：计算布局旋转角度
-    def _get_layout_rotation(self, station_val):
+    def _viewport_arrays(self):
+        """
+        把所有布局视口的中心、半宽高、旋转整理成数组 (SoA)，只扫描一次布局并缓存
+        """
+        if self._vp is None:
+            rows = []
+            for layout in self.doc.layouts:
+                if layout.name == 'Model' or layout.name == '布局1': continue
+                for entity in layout:
+                    if entity.dxftype() != 'VIEWPORT': continue
+
+                    vp = entity
+                    center = vp.dxf.view_target_point
+                    height = vp.dxf.view_height
+                    twist_deg = vp.dxf.view_twist_angle
+                    twist_rad = math.radians(twist_deg)
+                    width = height * (vp.dxf.width / vp.dxf.height)
+                    # 反向旋转 -twist 的 cos/sin，用于把目标点转到视口坐标系
+                    rows.append((center.x, center.y, width / 2, height / 2,
+                                 math.cos(-twist_rad), math.sin(-twist_rad), twist_deg))
+
+            arr = np.array(rows, dtype=np.float64).reshape(-1, 7)
+            self._vp = dict(zip(('cx', 'cy', 'half_w', 'half_h', 'cos', 'sin', 'twist_deg'), arr.T))
+        return self._vp
+
+    def find_best_viewport_rotation_many(self, xs, ys):
         """
-        根据桩号获取该点位所在布局视口的旋转角度。
-        逻辑：复用之前的 RouteCalculator 逻辑，获取该桩号处的道路切线角度。
-        为了在布局里看着是正的，模型空间里的文字需要旋转 -tangent_angle。
+        批量查找每个点所在的视口：所有点 [N, 1] 与所有视口 [1, V] 广播做包含判定
+        返回: (twists, found)，twists 为 -视口旋转角 (度)，found 为是否落在某个视口内
         """
-        # 注意：这里需要 RouteCalculator 提供一个 get_direction_at(station) 方法
-        # 如果 RouteCalculator 没有，我们需要简单实现一个
-        # 简单起见，我们重新计算一下该桩号在 Route 上的切线
-
-        # 使用 RouteCalculator 的内部数据寻找切线
-        # 这是一个简化的查找，假设 route.segments 已经按桩号排序
-        target_angle = 0.0
-        for seg in self.route.segments:
-            if seg['start_stat'] <= station_val <= (seg['start_stat'] + seg['logic_span']):
-                # 找到了所在段，计算该段的向量角度
-                vec = seg['vec']
-                target_angle = vec.angle  # 弧度
-                break
-
-        # 布局视口通常旋转 -target_angle 变平
-        # 所以为了让文字在布局里水平，文字在模型空间应该旋转 target_angle (或者 target_angle + pi)
-        # 使得文字平行于道路
-        return target_angle
+        vp = self._viewport_arrays()
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if len(vp['cx']) == 0:
+            return np.zeros(len(xs)), np.zeros(len(xs), dtype=bool)
+
+        dx = xs[:, None] - vp['cx']
+        dy = ys[:, None] - vp['cy']
+
+        # 判定包含：旋转到视口坐标系后落在半宽高之内
+        rx = dx * vp['cos'] - dy * vp['sin']
+        ry = dx * vp['sin'] + dy * vp['cos']
+        inside = (np.abs(rx) <= vp['half_w']) & (np.abs(ry) <= vp['half_h'])
+
+        # 择优录取：选离中心最近的那个视口 (只比较距离平方，无需开方)
+        d2 = np.where(inside, dx * dx + dy * dy, np.inf)
+        best = d2.argmin(axis=1)
+        found = inside.any(axis=1)
+        twists = np.where(found, -vp['twist_deg'][best], 0.0)
+        return twists, found
 
     def find_best_viewport_rotation(self, x, y, index=0):
-        p_target = Vec2(x, y)
-        best_twist = 0.0
-        min_dist_to_center = float('inf')
-        found = False
-
-        for layout in self.doc.layouts:
-            if layout.name == 'Model' or layout.name == '布局1': continue
-            for entity in layout:
-                if entity.dxftype() != 'VIEWPORT': continue
-
-                vp = entity
-                center = Vec2(vp.dxf.view_target_point)
-                height = vp.dxf.view_height
-                twist_deg = vp.dxf.view_twist_angle
-                twist_rad = math.radians(twist_deg)
-                width = height * (vp.dxf.width / vp.dxf.height)
-
-                # 判定包含
-                rel = (p_target - center).rotate(-twist_rad)
-                if abs(rel.x) <= width / 2 and abs(rel.y) <= height / 2:
-                    # 计算到中心的距离
-                    dist = p_target.distance(center)
-
-                    # 择优录取：选离中心最近的那个视口
-                    if dist < min_dist_to_center:
-                        min_dist_to_center = dist
-                        best_twist = twist_deg
-                        found = True
-
-        if found:
-            return -best_twist
+        twists, found = self.find_best_viewport_rotation_many([x], [y])
+        if found[0]:
+            return float(twists[0])
 
         # 兜底：如果没找到视口，回退到使用道路切线，保证至少有个角度
         print(f" -{index}- : ⚠️ 坐标 ({x:.1f}, {y:.1f}) 不在视口内，回退到道路切线方向。")
@@ -378,6 +443,37 @@ class DeviceLayoutEngine:
         return 0.0
 
     # 2. 新增核心方法：绘制图例和标注
+    def _legend_text_offset(self, legend_block_name, legend_scale):
+        """
+        计算图例块右侧边框中点 (加上文字间隙) 相对插入点的偏移向量 (未旋转)
+        块不存在时返回 None
+        """
+        if legend_block_name not in self.doc.blocks:
+            return None
+
+        # --- 计算包围盒宽度 (Bounding Box) ---
+        # 获取块定义
+        block_def = self.doc.blocks.get(legend_block_name)
+        # 计算该块定义的几何包围盒 (本地坐标)
+        extents = ezdxf.bbox.extents(block_def)
+
+        # 1. 获取右侧边框中点的【局部坐标】
+        # 右侧边界的X值 = extmax.x
+        # 上下边界的中心Y值 = center.y
+        local_right_mid_x = extents.extmax.x
+        local_right_mid_y = extents.center.y
+
+        # 2. 转换为向量 (相对于图块原点 0,0)
+        # 并加上缩放比例 (legend_scale)
+        # 这一步得到了图块在"未旋转"状态下，边缘相对于插入点的距离向量
+        vec_to_right_edge = Vec2(local_right_mid_x, local_right_mid_y) * legend_scale
+
+        # 3. 加上文字间隙 (Gap)
+        # 我们希望文字离方框还有一点距离 (例如 2.0 单位)
+        gap = 2.0 * legend_scale
+        # 将间隙加在 X 轴方向上
+        return vec_to_right_edge + Vec2(gap, 0)
+
     def draw_legends(self, devices, legend_source_file=None, legend_layer_color=6, legend_scale=3.5):
         """
         :param devices: extract_and_project_devices 返回的列表
@@ -398,87 +494,99 @@ class DeviceLayoutEngine:
         if layer_name not in self.doc.layers:
             self.doc.layers.add(name=layer_name, color=legend_layer_color)  # 白色
 
-        for dev in devices:
-            # 1. 确定旋转角度
-            # 我们希望文字和图例在布局里是正的。
-            # 道路切线角度是 road_angle。
-            # 布局旋转了 -road_angle。
-            # 所以模型空间里的物体如果旋转 road_angle，在布局里就是水平的。
-            viewport_twist_deg = self.find_best_viewport_rotation(dev.x, dev.y, dev.index)
-            viewport_twist_rad = math.radians(viewport_twist_deg)
-            road_tangent_rad = self._get_layout_rotation(dev.station_val)
-
-            # 2. 计算引线避让位置
-            # 策略：根据设备在左侧还是右侧，决定引线向外延伸的方向
-            # 左侧设备向左引，右侧设备向右引
-            # 初始引线长度 10m (根据实际单位调整，如果是mm则是10000)
-            lead_dist = 15.0 * 8  # if self.route.segments[0]['len_sq'] < 10000 else 15000.0
-
-            # 计算垂直于道路方向的向量 (法向量)
-            # 道路向量 (cos, sin)
-            # 左侧法向量 (-sin, cos), 右侧法向量 (sin, -cos)
-            if dev.side in ["左幅外侧", "Left", "Left"]:
-                leader_angle_rad = road_tangent_rad + (math.pi / 2)
-            else:
-                leader_angle_rad = road_tangent_rad - (math.pi / 2)
-
-            lead_vec = Vec2.from_angle(leader_angle_rad)
-
-            # 设备坐标
-            p_dev = Vec2(dev.x, dev.y)
-
-            # 图例插入点 (引线末端)
-            p_legend = p_dev + lead_vec * lead_dist
-
-            # 简单避让逻辑：如果和上一个太近，就再往外推或者沿道路方向错开
-            # 这里暂时只做简单的垂直引出，复杂的力导向需要迭代计算
+        if not devices:
+            return
+
+        # 1. 确定旋转角度 (先对所有设备算好，循环里只剩实体创建)
+        # 我们希望文字和图例在布局里是正的。
+        # 道路切线角度是 road_angle。
+        # 布局旋转了 -road_angle。
+        # 所以模型空间里的物体如果旋转 road_angle，在布局里就是水平的。
+        twists, found = self.find_best_viewport_rotation_many([dev.x for dev in devices], [dev.y for dev in devices])
+        for dev, ok in zip(devices, found.tolist()):
+            if not ok:
+                print(f" -{dev.index}- : ⚠️ 坐标 ({dev.x:.1f}, {dev.y:.1f}) 不在视口内，回退到道路切线方向。")
+        twist_degs = twists.tolist()
+        twist_rads = np.radians(twists).tolist()
+
+        # 2. 计算引线避让位置
+        # 策略：根据设备在左侧还是右侧，决定引线向外延伸的方向
+        # 左侧设备向左引，右侧设备向右引
+        # 初始引线长度 10m (根据实际单位调整，如果是mm则是10000)
+        lead_dist = 15.0 * 8  # if self.route.segments[0]['len_sq'] < 10000 else 15000.0
+
+        # 计算垂直于道路方向的向量 (法向量)
+        # 道路向量 (cos, sin)
+        # 左侧法向量 (-sin, cos), 右侧法向量 (sin, -cos)
+        # 道路方向按所在线段整列查表，cos/sin 在 RouteCalculator 里已经算好 (不在线段上时按 0 度)
+        seg_idx = self.route.segment_indices_at([dev.station_val for dev in devices])
+        on_route = seg_idx >= 0
+        road_cos = np.where(on_route, np.asarray(self.route.seg_cos)[seg_idx], 1.0)
+        road_sin = np.where(on_route, np.asarray(self.route.seg_sin)[seg_idx], 0.0)
+        # 左侧取 +1，右侧取 -1：(sin, -cos) 正好是 (-sin, cos) 取反
+        side_sign = np.array([1.0 if dev.side in ["左幅外侧", "Left", "Left"] else -1.0 for dev in devices])
+        lead_vecs = np.column_stack((-road_sin * side_sign, road_cos * side_sign))
+
+        # 设备坐标与图例插入点 (引线末端)，整列一次算完
+        p_devs = np.array([(dev.x, dev.y) for dev in devices], dtype=np.float64)
+        p_legends = (p_devs + lead_vecs * lead_dist).tolist()
+        p_devs = p_devs.tolist()
+
+        # 简单避让逻辑：如果和上一个太近，就再往外推或者沿道路方向错开
+        # 这里暂时只做简单的垂直引出，复杂的力导向需要迭代计算
+
+        # 各实体共用的属性字典只建一次 (ezdxf 创建实体时会复制一份，不会改动它们)
+        circle_attribs = {'layer': layer_name, 'color': 1}
+        insert_attribs = {
+            'layer': layer_name,
+            'rotation': 0.0,
+            'xscale': legend_scale,  # X轴缩放
+            'yscale': legend_scale,  # Y轴缩放
+            'zscale': legend_scale,  # Z轴缩放 (2D绘图通常也设为一致，或者1.0)
+        }
+        line_attribs = {
+            'layer': layer_name,
+            'color': legend_layer_color,
+        }
+        # 计算文字高度 (根据单位)
+        text_h = 10
+        mtext_attribs = {
+            'layer': layer_name,
+            'char_height': text_h,
+            'style': 'LegendTextStyle',
+            # 'rotation': rotation_deg,  # 旋转文字
+        }
+
+        # 图例块的包围盒只和块类型有关，按块名缓存：块不存在时记为 None
+        # 值为图块右侧边框中点 (加上文字间隙) 相对插入点的偏移向量，尚未旋转
+        legend_offsets = {}
+
+        for dev, viewport_twist_deg, viewport_twist_rad, p_dev, p_legend in zip(
+                devices, twist_degs, twist_rads, p_devs, p_legends):
+            p_dev = Vec2(p_dev)
+            p_legend = Vec2(p_legend)
 
             # 3. 插入图例块
             legend_block_name = f"{dev.name_str}_TL"  # 约定后缀
-            block_width = 5.0 * legend_scale
+
+            if legend_block_name not in legend_offsets:
+                legend_offsets[legend_block_name] = self._legend_text_offset(legend_block_name, legend_scale)
+            vec_total_offset = legend_offsets[legend_block_name]
 
             # 检查块是否存在，不存在则用默认块或跳过
-            if legend_block_name not in self.doc.blocks:
+            if vec_total_offset is None:
                 print(f"警告: 未找到图例块 {legend_block_name}，跳过图例绘制。")
                 # 也可以画个圆圈代替
-                self.msp.add_circle(p_legend, radius=2, dxfattribs={'layer': layer_name, 'color': 1})
+                self.msp.add_circle(p_legend, radius=2, dxfattribs=circle_attribs)
                 p_text = p_legend
             else:
+                insert_attribs['rotation'] = viewport_twist_deg
                 self.msp.add_blockref(
                     name=legend_block_name,
                     insert=p_legend,
-                    dxfattribs={
-                        'layer': layer_name,
-                        'rotation': viewport_twist_deg,
-                        'xscale': legend_scale,  # X轴缩放
-                        'yscale': legend_scale,  # Y轴缩放
-                        'zscale': legend_scale,  # Z轴缩放 (2D绘图通常也设为一致，或者1.0)
-                    }
+                    dxfattribs=insert_attribs
                 )
 
-                # --- 计算包围盒宽度 (Bounding Box) ---
-                # 获取块定义
-                block_def = self.doc.blocks.get(legend_block_name)
-                # 计算该块定义的几何包围盒 (本地坐标)
-                extents = ezdxf.bbox.extents(block_def)
-
-                # 2. 获取右侧边框中点的【局部坐标】
-                # 右侧边界的X值 = extmax.x
-                # 上下边界的中心Y值 = center.y
-                local_right_mid_x = extents.extmax.x
-                local_right_mid_y = extents.center.y
-
-                # 3. 转换为向量 (相对于图块原点 0,0)
-                # 并加上缩放比例 (legend_scale)
-                # 这一步得到了图块在"未旋转"状态下，边缘相对于插入点的距离向量
-                vec_to_right_edge = Vec2(local_right_mid_x, local_right_mid_y) * legend_scale
-
-                # 4. 加上文字间隙 (Gap)
-                # 我们希望文字离方框还有一点距离 (例如 2.0 单位)
-                gap = 2.0 * legend_scale
-                # 将间隙加在 X 轴方向上
-                vec_total_offset = vec_to_right_edge + Vec2(gap, 0)
-
                 # 5. 【关键】跟随道路旋转
                 # 将这个偏移向量旋转到道路的角度
                 vec_final_offset = vec_total_offset.rotate(viewport_twist_rad)   # !!!
@@ -487,10 +595,7 @@ class DeviceLayoutEngine:
                 p_text = p_legend + vec_final_offset
 
             # 4. 绘制引线 (连接设备点和图例点)
-            self.msp.add_line(p_dev, p_legend, dxfattribs={
-                'layer': layer_name,
-                'color': legend_layer_color,
-            })
+            self.msp.add_line(p_dev, p_legend, dxfattribs=line_attribs)
 
             bt = '路基' if dev.base_type == 'Road' else '桥梁'
             # 5. 添加多行文字信息
@@ -502,19 +607,8 @@ class DeviceLayoutEngine:
                 f"基础: {bt}"
             )
 
-            # 计算文字高度 (根据单位)
-            text_h = 10
-
             # 创建 MTEXT
-            mtext = self.msp.add_mtext(
-                content,
-                dxfattribs={
-                    'layer': layer_name,
-                    'char_height': text_h,
-                    'style': 'LegendTextStyle',
-                    # 'rotation': rotation_deg,  # 旋转文字
-                }
-            )
+            mtext = self.msp.add_mtext(content, dxfattribs=mtext_attribs)
 
             # 设置文字对齐和附着点
             # 这里的逻辑：左侧设备文字在左边右对齐，右侧设备文字在右边左对齐
@@ -1,8 +1,17 @@
 import ezdxf
+import re
+import shutil
 import sys
-from typing import List, Optional, Union, Tuple
+import numpy as np
+from typing import Dict, List, Optional, Union, Tuple
 from pathlib import Path
 
+# ATTRIB 实体的起始组 "  0 / ATTRIB" 及紧随其后的句柄组 "  5 / <句柄>" (文本 DXF，兼容 \r\n 行尾)
+_ATTRIB_HANDLE_RE = re.compile(rb'(?m)^ *0\r?\nATTRIB\r?\n *5\r?\n *([0-9A-Fa-f]+) *\r?\n')
+
+# 图框编号属性的标签 (驻留字符串，与同为驻留的标签比较时可直接按 id 命中)
+_TUNO = sys.intern('TUNO')
+
 
 class FrameAutoNumberer:
     """
@@ -18,9 +27,11 @@ class FrameAutoNumberer:
         源 DXF 文件的路径。
     doc : ezdxf.document.Drawing
         加载后的 DXF 文档对象。
+    frame_block_name : str or None
+        图框块名。设置后只查询该块名的块引用。
     """
 
-    def __init__(self, file_path: Union[str, Path]):
+    def __init__(self, file_path: Union[str, Path], frame_block_name: Optional[str] = None):
         """
         初始化编号器并加载 DXF 文件。
 
@@ -28,6 +39,9 @@ class FrameAutoNumberer:
         ----------
         file_path : str or Path
             源 DXF 文件路径。
+        frame_block_name : str, optional
+            图框块名。如果设置，查询时直接按块名过滤，其余块引用不再逐个检查属性。
+            默认为 None，即检查所有块引用。
 
         Raises
         ------
@@ -37,6 +51,7 @@ class FrameAutoNumberer:
             如果文件损坏或不是 DXF 格式。
         """
         self.file_path = Path(file_path)
+        self.frame_block_name = frame_block_name
         if not self.file_path.exists():
             raise FileNotFoundError(f"未找到源文件: {self.file_path}")
 
@@ -46,80 +61,326 @@ class FrameAutoNumberer:
             print(f"读取 DXF 失败: {e}")
             sys.exit(1)
 
-    def _get_sorted_frames(self, x_restrict: Optional[float], y_tolerance: float):
+        # 加载时源文件的修改时间和大小，用于判断之后能否直接改写源文件副本
+        stat = self.file_path.stat()
+        self._source_stat = (stat.st_mtime_ns, stat.st_size)
+
+        # 图框句柄 -> TUNo 属性，首次需要时扫描一次，之后重复编号直接复用
+        self._tuno_attribs: Optional[Dict[str, object]] = None
+        # 图框句柄 -> 源文件中的 TUNo 文字 (扫描时记下)，直接改写源文件副本时据此判断哪些属性变了
+        self._tuno_source_texts: Dict[str, str] = {}
+
+    def _collect_tuno_attribs(self) -> Dict[str, object]:
         """
-        内部辅助方法：获取、过滤并排序所有图框实体。
+        内部辅助方法：扫描模型空间，建立图框句柄到其 TUNo 属性的字典。
 
-        Parameters
-        ----------
-        x_restrict : float or None
-            X 轴过滤阈值。
-        y_tolerance : float
-            Y 轴行判定容差。
+        结果缓存在实例上，同一文档多次调用 `renumber_and_save` 时不再重复遍历 attribs。
 
         Returns
         -------
-        list
-            已排序的 ezdxf INSERT 实体列表。
+        dict
+            {INSERT 句柄: TUNo 属性}，按模型空间中的顺序排列。
         """
+        if self._tuno_attribs is not None:
+            return self._tuno_attribs
+
         msp = self.doc.modelspace()
-        valid_frames = []
+        tuno_attribs = {}
 
-        # 1. 收集符合条件的图框
-        for entity in msp.query('INSERT'):
+        # 已知图框块名时在查询里直接过滤，其他块引用不进入下面的循环
+        if self.frame_block_name is not None:
+            inserts = msp.query(f'INSERT[name=="{self.frame_block_name}"]')
+        else:
+            inserts = msp.query('INSERT')
+
+        for entity in inserts:
             # --- 修复点 1: 使用更稳健的方式检查属性是否存在 ---
             # ezdxf 的 attribs 属性是一个列表，如果没有属性则为空列表
-            # 直接判断列表长度即可，避免使用 has_attribs 标志位属性
-            if len(entity.attribs) == 0:
+            # 直接判断列表是否为空即可，避免使用 has_attribs 标志位属性
+            if not entity.attribs:
                 continue
 
-            # 检查是否有 TUNo 属性 (大小写不敏感)
-            has_tuno = False
+            # 检查是否有 TUNo 属性 (大小写不敏感)，找到时记下该属性
+            # 标签多数本来就是大写，先按 id / 直接比较，不相等时才调用 upper()
             for attrib in entity.attribs:
-                if attrib.dxf.tag.upper() == 'TUNO':
-                    has_tuno = True
+                tag = attrib.dxf.tag
+                if tag is _TUNO or tag == _TUNO or tag.upper() == _TUNO:
+                    tuno_attribs[entity.dxf.handle] = attrib
                     break
 
-            if not has_tuno:
-                continue
+        self._tuno_attribs = tuno_attribs
+        self._tuno_source_texts = {handle: attrib.dxf.text for handle, attrib in tuno_attribs.items()}
+        return tuno_attribs
 
-            # 坐标过滤
-            insert_point = entity.dxf.insert
-            if x_restrict is not None and insert_point.x <= x_restrict:
-                continue
+    def _source_unchanged(self) -> bool:
+        """
+        内部辅助方法：判断源文件自加载后是否未被改动。
+
+        Returns
+        -------
+        bool
+            修改时间和大小都与加载时一致时返回 True。
+        """
+        try:
+            stat = self.file_path.stat()
+        except OSError:
+            return False
+        return (stat.st_mtime_ns, stat.st_size) == self._source_stat
+
+    def _changed_tuno_texts(self) -> Dict[str, str]:
+        """
+        内部辅助方法：找出文字与源文件不同的所有 TUNo 属性。
+
+        与源文件中的文字比较，而不是与本次调用前的内存状态比较，
+        这样同一实例前几次编号留下的修改也会写进输出文件。
+
+        Returns
+        -------
+        dict
+            {ATTRIB 句柄: 当前文字}。
+        """
+        source_texts = self._tuno_source_texts
+        return {
+            attrib.dxf.handle: attrib.dxf.text
+            for handle, attrib in self._collect_tuno_attribs().items()
+            if attrib.dxf.text != source_texts[handle]
+        }
+
+    @staticmethod
+    def _row_ids(ys_desc: np.ndarray, y_tolerance: float) -> np.ndarray:
+        """
+        内部辅助方法：为按 Y 降序排列的图框分配行号。
+
+        行首随分组推进 (与当前行第一个图框比较)，不能用相邻差值的累加代替。
+        每一行用二分查找估计行尾，再用原判定条件前后修正到准确位置，
+        循环次数只与行数有关，与图框数无关。
+
+        Parameters
+        ----------
+        ys_desc : np.ndarray
+            降序排列的 Y 坐标。
+        y_tolerance : float
+            Y 轴行判定容差。
+
+        Returns
+        -------
+        np.ndarray
+            与 ys_desc 等长的行号数组 (从 0 开始)。
+        """
+        n = len(ys_desc)
+        neg_ys = -ys_desc  # 升序，供 searchsorted 使用
+        ys = ys_desc.tolist()
+
+        row_lengths = []
+        start = 0
+        while start < n:
+            row_y = ys[start]
+            # 估计第一个超出容差的位置，再按 abs(row_y - y) > y_tolerance 精确修正
+            end = max(int(np.searchsorted(neg_ys, y_tolerance - row_y, side='right')), start + 1)
+            while end > start + 1 and abs(row_y - ys[end - 1]) > y_tolerance:
+                end -= 1
+            while end < n and abs(row_y - ys[end]) <= y_tolerance:
+                end += 1
+            row_lengths.append(end - start)
+            start = end
+
+        return np.repeat(np.arange(len(row_lengths)), row_lengths)
+
+    @staticmethod
+    def _morton_keys(xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        内部辅助方法：计算各图框的 Z 序 (Morton) 编码。
+
+        坐标按包围盒归一化到 16 位整数网格，Y 轴翻转 (上方在前)，
+        再把 X、Y 的二进制位交错排列；Y 位在高位，使排序结果先上后下、再从左到右。
+
+        Parameters
+        ----------
+        xs, ys : np.ndarray
+            图框插入点的 X、Y 坐标。
+
+        Returns
+        -------
+        np.ndarray
+            uint64 的 Morton 编码数组。
+        """
+        def to_grid(values, flip):
+            lo, hi = values.min(), values.max()
+            span = hi - lo
+            scaled = (hi - values if flip else values - lo) / span if span > 0 else np.zeros_like(values)
+            return np.round(scaled * 0xFFFF).astype(np.uint64)
+
+        def spread_bits(v):
+            # 把 16 位整数的各位隔一位摊开：...b2 b1 b0 -> ...0 b2 0 b1 0 b0
+            v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF)
+            v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+            v = (v | (v << np.uint64(2))) & np.uint64(0x33333333)
+            v = (v | (v << np.uint64(1))) & np.uint64(0x55555555)
+            return v
+
+        gx = to_grid(xs, flip=False)
+        gy = to_grid(ys, flip=True)
+        return (spread_bits(gy) << np.uint64(1)) | spread_bits(gx)
+
+    @classmethod
+    def _sort_frame_indices(cls, xs: np.ndarray, ys: np.ndarray, x_restrict: Optional[float],
+                            y_tolerance: float, sort_strategy: str = 'rows') -> np.ndarray:
+        """
+        内部辅助方法：只根据坐标数组完成过滤和“从上到下、从左到右”的排序。
+
+        Parameters
+        ----------
+        xs, ys : np.ndarray
+            各图框插入点的 X、Y 坐标。
+        x_restrict : float or None
+            X 轴过滤阈值，只保留 X > x_restrict 的图框。
+        y_tolerance : float
+            Y 轴行判定容差。
+        sort_strategy : {'rows', 'morton'}, optional
+            'rows' 按行排序 (默认)；'morton' 按 Z 序 (Morton 码) 排序，忽略 y_tolerance。
+
+        Returns
+        -------
+        np.ndarray
+            排序后的图框下标 (对应 xs / ys 的位置)。
+        """
+        # 坐标过滤
+        idx = np.arange(len(xs))
+        if x_restrict is not None:
+            idx = idx[~(xs <= x_restrict)]
+        if len(idx) == 0:
+            return idx
+
+        if sort_strategy == 'morton':
+            return idx[np.argsort(cls._morton_keys(xs[idx], ys[idx]), kind='stable')]
+
+        # 先按 Y 轴降序排列 (从上到下)，稳定排序，Y 相同的保持原有顺序
+        idx = idx[np.argsort(-ys[idx], kind='stable')]
+
+        # 判断是否在同一行：与当前行第一个图框的 Y 差异在容差内
+        row_ids = cls._row_ids(ys[idx], y_tolerance)
 
-            valid_frames.append(entity)
+        # 行号为主键、X 轴升序 (从左到右) 为次键，一次稳定的 lexsort 得到最终顺序
+        return idx[np.lexsort((xs[idx], row_ids))]
 
-        # 2. 排序逻辑
-        # 先按 Y 轴降序排列 (从上到下)
-        valid_frames.sort(key=lambda e: e.dxf.insert.y, reverse=True)
+    def _iter_sorted_frames(self, x_restrict: Optional[float], y_tolerance: float, start: int,
+                            sort_strategy: str = 'rows'):
+        """
+        内部辅助方法：获取、过滤并排序所有图框，按顺序逐个产出编号。
+
+        Parameters
+        ----------
+        x_restrict : float or None
+            X 轴过滤阈值。
+        y_tolerance : float
+            Y 轴行判定容差。
+        start : int
+            编号的起始号。
+        sort_strategy : {'rows', 'morton'}, optional
+            排序方式，见 `_sort_frame_indices`。
 
-        sorted_frames = []
-        if valid_frames:
-            current_row = [valid_frames[0]]
+        Yields
+        ------
+        tuple
+            (编号文字, INSERT 实体, 其 TUNo 属性)，属性引用取自 `_collect_tuno_attribs` 的字典，
+            编号时无需再遍历 attribs。
+        """
+        # 1. 收集带 TUNo 属性的图框
+        tuno_attribs = self._collect_tuno_attribs()
+        if not tuno_attribs:
+            return
+
+        entitydb = self.doc.entitydb
+        tuno_frames = [entitydb[handle] for handle in tuno_attribs]
+        attribs = list(tuno_attribs.values())
+
+        # 插入点一次性读入 [N, 3] 数组，后面的过滤和排序都只在数组上进行
+        coords = np.fromiter((e.dxf.insert for e in tuno_frames), dtype=(np.float64, 3), count=len(tuno_frames))
+
+        # 2. 过滤和排序只依赖坐标数组，返回的是原列表中的下标
+        idx = self._sort_frame_indices(coords[:, 0], coords[:, 1], x_restrict, y_tolerance, sort_strategy)
+        # 编号文字按数量一次性生成，循环里不再逐个 str(int)
+        texts = map(str, range(start, start + len(idx)))
+        for text, i in zip(texts, idx.tolist()):
+            yield text, tuno_frames[i], attribs[i]
+
+    def _patch_tuno_texts(self, output_path: Union[str, Path], new_texts: Dict[str, str]) -> bool:
+        """
+        内部辅助方法：在源文件的字节副本上直接改写 TUNo 属性的文字并写出。
 
-            for frame in valid_frames[1:]:
-                # 判断是否在同一行 (Y轴差异在容差内)
-                last_y = current_row[0].dxf.insert.y
-                curr_y = frame.dxf.insert.y
+        只改动各 ATTRIB 的组码 1 (文字值) 所在行，其余内容原样保留，
+        省去 ezdxf 重新序列化整个文档的开销。new_texts 须包含所有与源文件
+        不同的 TUNo 属性 (见 `_changed_tuno_texts`)，否则输出会缺少这些修改。
 
-                if abs(last_y - curr_y) <= y_tolerance:
-                    current_row.append(frame)
-                else:
-                    # 结算当前行：按 X 轴升序 (从左到右)
-                    current_row.sort(key=lambda e: e.dxf.insert.x)
-                    sorted_frames.extend(current_row)
-                    current_row = [frame]
+        Parameters
+        ----------
+        output_path : str or Path
+            输出文件路径。
+        new_texts : dict
+            {ATTRIB 句柄: 新文字}。
 
-            # 结算最后一行
-            if current_row:
-                current_row.sort(key=lambda e: e.dxf.insert.x)
-                sorted_frames.extend(current_row)
+        Returns
+        -------
+        bool
+            成功写出时返回 True；源文件为二进制 DXF 或有属性在文件中找不到
+            (例如 R12 文件没有句柄，句柄是 ezdxf 加载时分配的) 时返回 False，
+            不写任何文件，由调用方回退到 `saveas`。
+        """
+        data = self.file_path.read_bytes()
+        if data.startswith(b'AutoCAD Binary DXF'):
+            return False
+
+        # 一次正则扫描定位所有 ATTRIB 及其句柄 (句柄组紧跟在 "0 / ATTRIB" 之后)；
+        # 不需要改的属性直接跳过，需要改的才按 (组码, 值) 两行一组往后读到第一个组码 1
+        patches = []
+        found = set()
+        for m in _ATTRIB_HANDLE_RE.finditer(data):
+            handle = m.group(1).decode('ascii').upper()
+            if handle not in new_texts:
+                continue
 
-        return sorted_frames
+            pos = m.end()
+            text_span = None
+            while pos < len(data):
+                code_end = data.find(b'\n', pos)
+                if code_end < 0:
+                    break
+                value_end = data.find(b'\n', code_end + 1)
+                if value_end < 0:
+                    value_end = len(data)
+                code = data[pos:code_end].strip()
+                if code == b'0':
+                    break
+                if code == b'1':
+                    # 保留原来的行尾 (\r\n 或 \n)，只替换值本身
+                    end = value_end - 1 if data[value_end - 1:value_end] == b'\r' else value_end
+                    text_span = (code_end + 1, end)
+                    break
+                pos = value_end + 1
+
+            if text_span is not None:
+                patches.append((text_span, new_texts[handle]))
+                found.add(handle)
+
+        # 每个要改的属性都必须在文件中恰好找到一次
+        if len(patches) != len(new_texts) or len(found) != len(new_texts):
+            return False
+
+        # 按文件位置顺序拼接：未改动的片段直接复用原始字节
+        patches.sort()
+        chunks = []
+        last = 0
+        for (begin, end), text in patches:
+            chunks.append(data[last:begin])
+            chunks.append(text.encode('ascii'))
+            last = end
+        chunks.append(data[last:])
+        Path(output_path).write_bytes(b''.join(chunks))
+        return True
 
     def renumber_and_save(self, output_path: Union[str, Path], x_restrict: Optional[float] = None, start: Optional[int] = 2,
-                          y_tolerance: float = 1.0):
+                          y_tolerance: float = 1.0, patch_source: bool = False, output_format: str = 'dxf',
+                          sort_strategy: str = 'rows'):
         """
         执行编号逻辑并保存文件。
 
@@ -136,34 +397,60 @@ class FrameAutoNumberer:
             编号的起始号。
         y_tolerance : float, optional
             行对齐容差，用于模糊匹配 Y 坐标。默认为 1.0。
+        patch_source : bool, optional
+            是否直接在源文件副本上改写 TUNo 文字 (不经过 ezdxf 重新序列化整个文档)；
+            编号全部与源文件相同时直接复制源文件。默认为 False。
+            注意：输出只以源文件的字节为底稿，除 TUNo 文字外，调用方对 `self.doc`
+            做的其他改动 (新增实体、修改其他属性等) 都不会写入输出文件，也不会被检测到。
+            只在除编号外没有动过 `self.doc` 时开启。
+            源文件不是文本 DXF、磁盘上的源文件在加载后被改写过 (按修改时间和大小判断)
+            或找不到全部属性时自动回退到 `saveas`。
+        output_format : {'dxf', 'bin', 'dwg'}, optional
+            输出格式。'dxf' 为文本 DXF (默认)；'bin' 为二进制 DXF，写出更快、文件更小；
+            'dwg' 通过 ezdxf 的 odafc 插件转换，需要本机安装 ODA File Converter。
+            只有 'dxf' 会使用 patch_source 的直接改写。
+        sort_strategy : {'rows', 'morton'}, optional
+            排序方式。'rows' 为“从上到下、从左到右”按行排序 (默认)；
+            'morton' 按 Z 序空间填充曲线排序，不需要调 y_tolerance，
+            适合排版不规整、难以划分行的图纸。
 
         Returns
         -------
         int
             成功修改并编号的图框数量。
         """
-        # 获取排序后的实体对象
-        sorted_entities = self._get_sorted_frames(x_restrict, y_tolerance)
+        if output_format not in ('dxf', 'bin', 'dwg'):
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        if sort_strategy not in ('rows', 'morton'):
+            raise ValueError(f"不支持的排序方式: {sort_strategy}")
 
+        # 按排序结果逐个产出 (编号文字, 实体, TUNo 属性)，边排边改，不再另存排序后的列表
+        # --- 修复点 2: 不用 get_attrib，TUNo 属性在排序前手动遍历时已找到 ---
         count = 0
-        for idx, entity in enumerate(sorted_entities, start=start):
-
-            # --- 修复点 2: 移除 get_attrib 调用，改为手动遍历 ---
-            # 为了兼容不同版本的 ezdxf，直接遍历查找是最安全的方法
-            target_attrib = None
-            for attrib in entity.attribs:
-                if attrib.dxf.tag.upper() == 'TUNO':
-                    target_attrib = attrib
-                    break
-
+        for text, entity, target_attrib in self._iter_sorted_frames(x_restrict, y_tolerance, start, sort_strategy):
             # 修改属性值
-            if target_attrib:
-                target_attrib.dxf.text = str(idx)
-                count += 1
+            target_attrib.dxf.text = text
+            count += 1
+
+        # 直接改写源文件副本的前提：磁盘上的源文件自加载后没有被改动 (包括被之前的调用覆盖)；
+        # self.doc 中 TUNo 以外的改动无法察觉，由调用方决定是否开启 patch_source
+        # 与源文件不同的属性包括本实例之前各次调用的修改，而不只是本次编号
+        use_source = patch_source and self._source_unchanged()
+        changed_texts = self._changed_tuno_texts() if use_source else None
 
         # 保存文件
         try:
-            self.doc.saveas(output_path)
+            if output_format == 'dwg':
+                from ezdxf.addons import odafc
+                odafc.export_dwg(self.doc, str(output_path), replace=True)
+            elif output_format == 'bin':
+                self.doc.saveas(output_path, fmt='bin')
+            elif use_source and not changed_texts:
+                # 所有编号都与源文件相同 (例如 x_restrict 排除了所有图框)：直接复制源文件
+                if Path(output_path).resolve() != self.file_path.resolve():
+                    shutil.copyfile(self.file_path, output_path)
+            elif not (use_source and self._patch_tuno_texts(output_path, changed_texts)):
+                self.doc.saveas(output_path)
             print(f"成功处理 {count} 个图框，已保存至: {output_path}")
         except IOError as e:
             print(f"保存文件失败: {e}")
@@ -187,6 +474,7 @@ if __name__ == "__main__":
             x_restrict=500,
             y_tolerance=1.0,
             start=2,
+            patch_source=True,  # 除编号外没有改动文档，可以直接改写源文件副本
         )
     else:
         print(f"请准备测试文件: {input_file}")
\ No newline at end of file
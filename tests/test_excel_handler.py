@@ -0,0 +1,52 @@
+import io
+import contextlib
+import tempfile
+import unittest
+from pathlib import Path
+
+from highwaype.io.excel_handler import ExcelManager
+from highwaype.modules.device_layout import DeviceRecord
+
+
+def make_device(index, name):
+    return DeviceRecord(index=index, name=name, name_str='CCTV', station_str='K0+001', station_val=1.0,
+                        base_type='Road', side='左幅外侧', offset=1.0, x=1.0, y=2.0)
+
+
+class ExcelManagerTest(unittest.TestCase):
+    def test_missing_excel_info_leaves_no_file(self):
+        devices = [make_device(i, '摄像机' if i % 5 else '情报板') for i in range(1, 21)]
+        with tempfile.TemporaryDirectory() as tmp:
+            out = Path(tmp) / 'devices.xlsx'
+            with contextlib.redirect_stdout(io.StringIO()):
+                with self.assertRaises(KeyError):
+                    ExcelManager.save_device_list(devices, out, {'摄像机': ('杆A', '配置A')})
+            self.assertFalse(out.exists())
+
+    def test_invalid_input_leaves_no_file(self):
+        infos = {'摄像机': ('杆A', '配置A')}
+        bad_base = [make_device(1, '摄像机')]
+        bad_base[0].base_type = 'Tunnel'
+        cases = [
+            (KeyError, [('点位一览表', bad_base)]),
+            (ValueError, [('Sheet', [make_device(1, '摄像机')]), ('sheet', [make_device(2, '摄像机')])]),
+            (ValueError, [('a/b', [make_device(1, '摄像机')])]),
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            out = Path(tmp) / 'devices.xlsx'
+            for error, groups in cases:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    with self.assertRaises(error):
+                        ExcelManager.save_device_lists(groups, out, infos)
+                self.assertFalse(out.exists())
+
+    def test_unwritable_path_is_reported(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                ExcelManager.save_device_list([make_device(1, '摄像机')], tmp, {'摄像机': ('杆A', '配置A')})
+            self.assertIn('请检查文件是否被打开', stdout.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
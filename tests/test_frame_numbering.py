@@ -0,0 +1,89 @@
+import io
+import contextlib
+import tempfile
+import unittest
+from pathlib import Path
+
+import ezdxf
+
+from highwaype.modules.frame_numbering import FrameAutoNumberer
+
+
+def make_frames_dxf(path, old_numbers):
+    """一行图框，X 依次为 0, 100, 200 ...，TUNo 预先填入 old_numbers"""
+    doc = ezdxf.new('R2018')
+    block = doc.blocks.new('TK')
+    block.add_attdef('TUNO', (0, 0))
+    block.add_attdef('OTHER', (0, 5))
+    msp = doc.modelspace()
+    for i, number in enumerate(old_numbers):
+        insert = msp.add_blockref('TK', (i * 100, 0))
+        insert.add_auto_attribs({'TUNO': number, 'OTHER': 'o'})
+    doc.saveas(path)
+
+
+def read_tuno_texts(path):
+    """按 X 从左到右读出各图框的 TUNo 文字"""
+    doc = ezdxf.readfile(path)
+    inserts = sorted(doc.modelspace().query('INSERT'), key=lambda e: e.dxf.insert.x)
+    return [next(a.dxf.text for a in e.attribs if a.dxf.tag == 'TUNO') for e in inserts]
+
+
+class FrameAutoNumbererSaveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.src = self.dir / 'frames.dxf'
+        make_frames_dxf(self.src, ['99', '98', '97', '96', '95', '94'])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def renumber(self, numberer, name, **kwargs):
+        out = self.dir / name
+        with contextlib.redirect_stdout(io.StringIO()):
+            numberer.renumber_and_save(out, **kwargs)
+        return read_tuno_texts(out)
+
+    def test_patched_output_matches_saveas(self):
+        patched = FrameAutoNumberer(self.src)
+        saved = FrameAutoNumberer(self.src)
+        for step, kwargs in enumerate([dict(start=1), dict(start=1, x_restrict=50)]):
+            self.assertEqual(
+                self.renumber(patched, f'patched{step}.dxf', patch_source=True, **kwargs),
+                self.renumber(saved, f'saved{step}.dxf', **kwargs),
+            )
+
+    def test_repeated_calls_keep_numbers(self):
+        numberer = FrameAutoNumberer(self.src)
+        expected = ['1', '2', '3', '4', '5', '6']
+        self.assertEqual(self.renumber(numberer, 'out1.dxf', start=1, patch_source=True), expected)
+        # 第二次编号内存里没有任何变化，但输出仍须带上编号，而不是复制原文件
+        self.assertEqual(self.renumber(numberer, 'out2.dxf', start=1, patch_source=True), expected)
+
+    def test_unchanged_numbers_copy_source(self):
+        numberer = FrameAutoNumberer(self.src)
+        out = self.dir / 'copy.dxf'
+        with contextlib.redirect_stdout(io.StringIO()):
+            numberer.renumber_and_save(out, x_restrict=1e9, patch_source=True)
+        self.assertEqual(out.read_bytes(), self.src.read_bytes())
+
+    def test_overwrite_source_then_renumber(self):
+        numberer = FrameAutoNumberer(self.src)
+        self.assertEqual(self.renumber(numberer, 'frames.dxf', start=1, patch_source=True),
+                         ['1', '2', '3', '4', '5', '6'])
+        # 源文件已被覆盖，不能再以它为底稿改写
+        self.assertEqual(self.renumber(numberer, 'again.dxf', start=11, x_restrict=350, patch_source=True),
+                         ['1', '2', '3', '4', '11', '12'])
+
+    def test_default_keeps_other_doc_edits(self):
+        numberer = FrameAutoNumberer(self.src)
+        numberer.doc.modelspace().add_line((0, -50), (500, -50), dxfattribs={'layer': 'EXTRA'})
+        out = self.dir / 'edited.dxf'
+        with contextlib.redirect_stdout(io.StringIO()):
+            numberer.renumber_and_save(out, start=1)
+        self.assertEqual(len(ezdxf.readfile(out).modelspace().query('LINE[layer=="EXTRA"]')), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
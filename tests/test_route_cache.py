@@ -0,0 +1,72 @@
+import io
+import contextlib
+import tempfile
+import unittest
+from pathlib import Path
+
+import ezdxf
+import numpy as np
+
+from highwaype.io.dxf_handler import AutoPlotter
+
+
+def make_centerline_dxf(path):
+    """CENTERLINE 图层上一条折线"""
+    doc = ezdxf.new('R2018')
+    doc.modelspace().add_lwpolyline([(0, 0), (500, 0), (800, 300)], dxfattribs={'layer': 'CENTERLINE'})
+    doc.saveas(path)
+
+
+class RouteCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.src = self.dir / 'route.dxf'
+        self.cache_dir = self.dir / 'cache'
+        make_centerline_dxf(self.src)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def route_xy(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            plotter = AutoPlotter(str(self.src), route_cache_dir=self.cache_dir)
+            return plotter.get_route()._xy, plotter._route_cache_file()
+
+    def test_cache_round_trip(self):
+        xy, cache_file = self.route_xy()
+        self.assertTrue(cache_file.exists())
+        cached_xy, _ = self.route_xy()
+        np.testing.assert_array_equal(cached_xy, xy)
+
+    def test_bad_cache_falls_back_to_parsing(self):
+        xy, cache_file = self.route_xy()
+        for content in (b'garbage', b''):
+            cache_file.write_bytes(content)
+            np.testing.assert_array_equal(self.route_xy()[0], xy)
+        # 合法的 .npy 但形状不对，同样重新解析
+        np.save(cache_file, np.zeros(3))
+        np.testing.assert_array_equal(self.route_xy()[0], xy)
+
+    def test_cache_hit_skips_reading_dxf(self):
+        xy, _ = self.route_xy()
+        with contextlib.redirect_stdout(io.StringIO()):
+            plotter = AutoPlotter(str(self.src), route_cache_dir=self.cache_dir)
+            np.testing.assert_array_equal(plotter.get_route()._xy, xy)
+            plotter.calculate_frames(plotter.get_route())
+        self.assertIsNone(plotter._doc)
+
+    def test_cache_version_changes_key(self):
+        _, cache_file = self.route_xy()
+        with contextlib.redirect_stdout(io.StringIO()):
+            plotter = AutoPlotter(str(self.src), route_cache_dir=self.cache_dir)
+        plotter.ROUTE_CACHE_VERSION += 1
+        self.assertNotEqual(plotter._route_cache_file(), cache_file)
+
+    def test_no_temp_files_left(self):
+        self.route_xy()
+        self.assertEqual([p.suffix for p in self.cache_dir.iterdir()], ['.npy'])
+
+
+if __name__ == '__main__':
+    unittest.main()